@@ -0,0 +1,328 @@
+"""Benchmarks the slash-command handlers against synthetic quote corpora
+
+Every handler callback is driven through fake interactions (no network),
+against a fresh quote directory per corpus size:
+
+    python -m benchmarks.commands --sizes 1k,100k,1m --save baseline.json
+    python -m benchmarks.commands --compare baseline.json
+
+Reports latency percentiles per handler plus the peak memory it allocated
+(tracemalloc, measured in a separate pass so it doesn't skew the timings).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+from benchmarks.common import BENCH_OWNER_ID, load_bot, max_rss_mb, summarize
+from benchmarks.corpus import WORDS, generate_quotes, parse_size, write_corpus
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeInteraction, FakeUser
+from quote_server import LocalQuotes
+from scheduler import RateLimitScheduler
+
+# Skipped: /shutdown closes the bot and /sync talks to Discord
+SKIPPED = ("shutdown", "sync")
+
+
+class BenchContext:
+    """Guild, channel and users one corpus is benchmarked with"""
+
+    def __init__(self, main, namespace, corpus):
+        self.main = main
+        self.namespace = namespace
+        self.guild = FakeGuild(int(namespace))
+        self.channel = FakeChannel(self.guild)
+        self.owner = FakeUser("owner", BENCH_OWNER_ID)
+        # The most quoted authors, so /mine has real work to do
+        authors = Counter(q["author"].split(",")[0] for q in corpus[:20000])
+        self.members = [FakeUser(name) for name, _ in authors.most_common(50)]
+        self.size = len(corpus)
+        self.deleted = 0
+        self.presence_updates = 0
+
+    def member(self, i):
+        return self.members[i % len(self.members)]
+
+    async def run(self, command, user, channel=None, **options):
+        interaction = FakeInteraction(user, self.guild, channel or self.channel)
+        # Handlers log to stdout; keep that out of the report
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            await command.callback(interaction, **options)
+        if not interaction.sent:
+            raise RuntimeError(f"/{command.name} sent no response")
+        return interaction
+
+    async def complete(self, autocomplete, user, current):
+        """Choices an autocomplete callback offers for what user has typed"""
+        interaction = FakeInteraction(user, self.guild, self.channel)
+        choices = await autocomplete(interaction, current)
+        if not choices:
+            raise RuntimeError(f"{autocomplete.__name__} offered nothing for {current!r}")
+        return choices
+
+
+# -------------------------------
+# Cases: one call of a handler for iteration i
+# -------------------------------
+async def case_commands(ctx, i):
+    await ctx.run(ctx.main.commands_slash, ctx.member(i))
+
+
+async def case_create(ctx, i):
+    await ctx.run(ctx.main.create_slash, ctx.member(i), quote=f"{WORDS[i % len(WORDS)]} benchmark quote {i}")
+
+
+async def case_add(ctx, i):
+    # Served from the on_message buffer
+    await ctx.run(ctx.main.add_slash, ctx.member(i), messages=1 + i % 3)
+
+
+async def case_add_history(ctx, i):
+    # A channel the buffer hasn't seen, so /add pages through history
+    channel = FakeChannel(ctx.guild)
+    for n in range(20):
+        channel.post(ctx.member(n), f"message {n} {WORDS[n % len(WORDS)]}")
+    await ctx.run(ctx.main.add_slash, ctx.member(i), channel=channel, messages=2)
+
+
+async def case_edit(ctx, i):
+    quote_id = 1 + (i * 7919) % ctx.size
+    await ctx.run(ctx.main.edit_slash, ctx.owner, quote_id=quote_id, new_text=f"edited {i}")
+
+
+async def case_delete(ctx, i):
+    # From the top of the id range down, so every call deletes a quote that exists
+    quote_id = ctx.size - ctx.deleted
+    ctx.deleted += 1
+    await ctx.run(ctx.main.delete_slash, ctx.owner, quote_id=quote_id)
+
+
+async def case_mine(ctx, i):
+    await ctx.run(ctx.main.mine_slash, ctx.member(i))
+
+
+async def case_search(ctx, i):
+    query = f"{WORDS[i % len(WORDS)]} {WORDS[(i * 31) % len(WORDS)]}"
+    await ctx.run(ctx.main.search_slash, ctx.member(i), query=query)
+
+
+async def case_all(ctx, i):
+    await ctx.run(ctx.main.all_slash, ctx.owner)
+
+
+async def case_random(ctx, i):
+    await ctx.run(ctx.main.random_slash, ctx.member(i))
+
+
+async def case_daily(ctx, i):
+    await ctx.run(ctx.main.daily_slash, ctx.member(i))
+
+
+async def case_cycle(ctx, i):
+    await ctx.run(ctx.main.cycle_slash, ctx.owner)
+
+
+async def case_rave(ctx, i):
+    # Toggle on and straight off again
+    await ctx.run(ctx.main.rave_slash, ctx.owner)
+    await ctx.run(ctx.main.rave_slash, ctx.owner)
+
+
+async def case_shards(ctx, i):
+    await ctx.run(ctx.main.shards_slash, ctx.owner)
+
+
+async def case_complete_id(ctx, i):
+    # Members only see their own quotes; the owner typing digits or words sees everyone's
+    if i % 2:
+        await ctx.complete(ctx.main.quote_id_autocomplete, ctx.member(i), "")
+    else:
+        await ctx.complete(ctx.main.quote_id_autocomplete, ctx.owner, str(1 + i % 9) if i % 4 else WORDS[i % len(WORDS)][:3])
+
+
+async def case_complete_author(ctx, i):
+    await ctx.complete(ctx.main.author_autocomplete, ctx.member(i), ctx.member(i).name[:1 + i % 4])
+
+
+CASES = {
+    "commands": case_commands,
+    "create": case_create,
+    "add": case_add,
+    "add_history": case_add_history,
+    "edit": case_edit,
+    "delete": case_delete,
+    "mine": case_mine,
+    "search": case_search,
+    "all": case_all,
+    "random": case_random,
+    "daily": case_daily,
+    "cycle": case_cycle,
+    "rave": case_rave,
+    "shards": case_shards,
+    "complete_id": case_complete_id,
+    "complete_author": case_complete_author,
+}
+
+
+async def time_case(case, ctx, iterations, warmup, offset):
+    for i in range(offset, offset + warmup):
+        await case(ctx, i)
+    samples = []
+    for i in range(offset + warmup, offset + warmup + iterations):
+        start = time.perf_counter()
+        await case(ctx, i)
+        samples.append(time.perf_counter() - start)
+        # Let tasks the handler started (presence updates, raves) run, untimed
+        await asyncio.sleep(0)
+    return samples
+
+
+async def peak_memory(case, ctx, iterations, offset):
+    """Most memory allocated at once while running the case"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(offset, offset + iterations):
+            await case(ctx, i)
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_size(main, directory, size, args):
+    namespace = "100000000000000000"
+    corpus = generate_quotes(size, seed=args.seed)
+    quote_dir = directory / f"quotes-{size}"
+    quote_dir.mkdir()
+    write_corpus(quote_dir / f"{namespace}.json", corpus)
+
+    main.QUOTE_DIR = quote_dir
+    main.STATUS_NAMESPACE = namespace
+    main.status_quote_id = None
+    main.quotes = LocalQuotes(main.open_registry())
+
+    ctx = BenchContext(main, namespace, corpus)
+    del corpus
+
+    async def record_presence(value, key=None):
+        ctx.presence_updates += 1
+    main.scheduler.close()
+    main.scheduler = RateLimitScheduler(record_presence)
+
+    for n in range(main.MESSAGE_BUFFER_DEPTH):
+        main.message_buffer.add(ctx.channel.post(ctx.member(n), f"buffered message {n} {WORDS[n % len(WORDS)]}"))
+
+    start = time.perf_counter()
+    await main.quotes.count(namespace)
+    result = {"load_s": round(time.perf_counter() - start, 4), "commands": {}}
+
+    offset = 0
+    for name, case in CASES.items():
+        if args.only and name not in args.only:
+            continue
+        # Leave most of the corpus in place for the handlers after /delete
+        iterations = max(1, min(args.iterations, size // 4)) if name == "delete" else args.iterations
+        samples = await time_case(case, ctx, iterations, args.warmup, offset)
+        offset += iterations + args.warmup
+        stats = summarize(samples)
+        memory_iterations = min(iterations, args.memory_iterations)
+        stats["peak_alloc_kb"] = round(await peak_memory(case, ctx, memory_iterations, offset) / 1024, 1)
+        offset += memory_iterations
+        result["commands"][name] = stats
+        print(
+            f"{size:>9} {name:<15} p50 {stats['p50_ms']:>9.3f} ms  p90 {stats['p90_ms']:>9.3f} ms  "
+            f"p99 {stats['p99_ms']:>9.3f} ms  peak {stats['peak_alloc_kb']:>10.1f} KiB"
+        )
+
+    for session in main.rave_sessions.values():
+        session.stop()
+    main.rave_sessions.clear()
+    main.scheduler.close()
+    await main.quotes.close()
+    result["max_rss_mb"] = max_rss_mb()
+    return result
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Handlers whose p50 or p99 got slower than the baseline by more than tolerance
+
+    Slowdowns under min_delta_ms are ignored, they are mostly timer noise.
+    """
+    regressions = []
+    for size, current in results["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if not previous:
+            continue
+        for name, stats in current["commands"].items():
+            old = previous["commands"].get(name)
+            if not old:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                if stats[key] > old[key] * (1 + tolerance) and stats[key] - old[key] >= min_delta_ms:
+                    regressions.append(f"{size} {name} {key}: {old[key]:.3f} -> {stats[key]:.3f} ms")
+    return regressions
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory(prefix="qred-bench-") as tmp:
+        directory = pathlib.Path(tmp)
+        main = load_bot(directory)
+        results = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": main.QUOTE_STORAGE,
+            "iterations": args.iterations,
+            "skipped": list(SKIPPED),
+            "sizes": {},
+        }
+        for size in args.sizes:
+            results["sizes"][str(size)] = await bench_size(main, directory, size, args)
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,100k,1m", help="corpus sizes, e.g. 1k,100k,1m")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-iterations", type=int, default=20)
+    parser.add_argument("--only", help="comma-separated handlers to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to check the results against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+    args.sizes = [parse_size(size) for size in args.sizes.split(",")]
+    args.only = set(args.only.split(",")) if args.only else None
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import importlib
+import os
+import resource
+
+BENCH_OWNER_ID = 4242
+
+
+def load_bot(directory):
+    """Import main.py with its storage pointed at a scratch directory"""
+    os.environ["DISCORD_TOKEN"] = "benchmark"
+    os.environ["OWNER_ID"] = str(BENCH_OWNER_ID)
+    os.environ["QUOTE_DIR"] = str(directory / "quotes")
+    os.environ["QUOTE_FILE"] = str(directory / "legacy-quotes.json")
+    os.environ.pop("QUOTE_SOCKET", None)
+    return importlib.import_module("main")
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_samples) - 1, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Latency percentiles in ms for a list of durations in seconds"""
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000, 4)
+    return {
+        "count": len(samples),
+        "p50_ms": ms(percentile(samples, 0.50)),
+        "p90_ms": ms(percentile(samples, 0.90)),
+        "p99_ms": ms(percentile(samples, 0.99)),
+        "max_ms": ms(samples[-1]),
+        "mean_ms": ms(sum(samples) / len(samples)),
+    }
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
@@ -0,0 +1,77 @@
+import itertools
+import random
+
+from quote_store import meta_path_for, write_json_atomic
+
+# Words quotes are made of, Polish and English like the real ones
+WORDS = (
+    "nie tak jak to jest co się no ale już czy wiesz może bo tylko trzeba "
+    "zawsze nigdy dzisiaj jutro kawa szkoła praca życie filozofia prawda "
+    "the a is it that what you know never always why because maybe really "
+    "coffee school work life truth bro literally actually honestly again "
+    "ósemka źródło żółw łódź gęś ćma śnieg"
+).split()
+
+FIRST_NAMES = (
+    "kuba ola wiktor zosia bartek natalia mateusz julia szymon maja "
+    "adam lena filip hania igor pola oskar nina kacper ida"
+).split()
+
+
+def _author_pool(size, rng):
+    names = []
+    for i in range(size):
+        name = rng.choice(FIRST_NAMES)
+        # Mix of plain names and discord-style handles
+        names.append(name if i < len(FIRST_NAMES) else f"{name}_{rng.randrange(10, 9999)}")
+    return list(dict.fromkeys(names))
+
+
+def _text(rng, mention_rate):
+    words = [rng.choice(WORDS) for _ in range(max(1, int(rng.lognormvariate(2.3, 0.6))))]
+    if rng.random() < mention_rate:
+        # Mentions are stripped for the status, so they shift which quotes fit in it
+        for _ in range(rng.randint(1, 3)):
+            mention = rng.choice(("<@{}>", "<@!{}>", "<@&{}>", "<#{}>")).format(rng.randrange(10 ** 17, 10 ** 18))
+            words.insert(rng.randrange(len(words) + 1), mention)
+    text = " ".join(words)
+    return text[:500]
+
+
+def generate_quotes(count, seed=0, mention_rate=0.15, multi_author_rate=0.1, authors=None):
+    """Synthetic quotes with ids 1..count
+
+    Authors follow a skewed distribution (a few people are quoted a lot),
+    `mention_rate` of quotes contain Discord mentions and `multi_author_rate`
+    are credited to several people ("a, b").
+    """
+    rng = random.Random(seed)
+    pool = _author_pool(authors or max(20, min(5000, count // 50)), rng)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(pool))))
+    quotes = []
+    for quote_id in range(1, count + 1):
+        if rng.random() < multi_author_rate:
+            names = rng.choices(pool, cum_weights=cum_weights, k=rng.randint(2, 3))
+            author = ", ".join(dict.fromkeys(names))
+        else:
+            author = rng.choices(pool, cum_weights=cum_weights)[0]
+        quotes.append({
+            "id": quote_id,
+            "text": _text(rng, mention_rate),
+            "author": author,
+            "date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2026)}"
+        })
+    return quotes
+
+
+def write_corpus(path, quotes):
+    """Write quotes as a namespace's quotes.json (every backend imports from it)"""
+    write_json_atomic(path, quotes)
+    write_json_atomic(meta_path_for(path), {"next_id": len(quotes) + 1})
+
+
+def parse_size(text):
+    """'1k' -> 1000, '1m' -> 1000000"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
@@ -0,0 +1,143 @@
+"""Stand-ins for the discord.py objects the command handlers touch
+
+Only what main.py uses is implemented. Everything a handler sends is recorded
+on the interaction (`sent`) instead of going out over the network.
+"""
+import asyncio
+import itertools
+import random
+
+_snowflakes = itertools.count(10 ** 17)
+
+
+def snowflake():
+    return next(_snowflakes)
+
+
+class FakeRest:
+    """Stand-in for Discord's REST API: every call takes latency ± jitter seconds"""
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FakeUser:
+    def __init__(self, name, user_id=None, bot=False):
+        self.id = user_id or snowflake()
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id=None, shard_id=0):
+        self.id = guild_id or snowflake()
+        self.shard_id = shard_id
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content):
+        self.id = snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.guild = channel.guild
+
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeChannel:
+    """A text channel whose history is an in-memory list (oldest first)"""
+
+    def __init__(self, guild=None, channel_id=None, messages=()):
+        self.id = channel_id or snowflake()
+        self.guild = guild
+        self.messages = list(messages)
+        self.sent = []
+
+    def post(self, author, content):
+        message = FakeMessage(self, author, content)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(self, FakeUser("qred", bot=True), content or "")
+        self.sent.append((content, kwargs))
+        return message
+
+    async def history(self, limit=100):
+        for message in reversed(self.messages[-limit:] if limit else self.messages):
+            yield message
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self._interaction.round_trip()
+        self._interaction.sent.append(("response", content, kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self._interaction.round_trip()
+        self._interaction.sent.append(("defer", None, kwargs))
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        await self._interaction.round_trip()
+        self._interaction.sent.append(("edit", None, kwargs))
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self._interaction.round_trip()
+        self._interaction.sent.append(("followup", content, kwargs))
+
+
+class FakeInteraction:
+    def __init__(self, user, guild=None, channel=None, rest=None):
+        self.id = snowflake()
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.channel = channel
+        self.command = None
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.rest = rest
+        self.sent = []
+
+    async def round_trip(self):
+        if self.rest is not None:
+            await self.rest.call()
+
+    async def original_response(self):
+        return FakeMessage(self.channel or FakeChannel(self.guild), FakeUser("qred", bot=True), "")
+
+    @property
+    def reply(self):
+        """Text of the first thing the handler sent back"""
+        for kind, content, kwargs in self.sent:
+            if kind != "defer":
+                return content if content is not None else kwargs.get("embed")
+        return None
@@ -0,0 +1,378 @@
+"""Replays interaction storms against the bot and checks no quote gets lost
+
+Interactions are dispatched as their own tasks at their trace times, the way
+discord.py delivers gateway events, and every response goes through a fake
+REST layer with configurable latency:
+
+    python -m benchmarks.load --rate 200 --count 2000 --verify
+    python -m benchmarks.load --burst --count 500 --cluster --verify
+    python -m benchmarks.load --save-trace storm.jsonl
+    python -m benchmarks.load --trace storm.jsonl
+
+A trace is JSON lines of {"t": seconds, "command": name, "guild": id,
+"user": name or "owner", "options": {...}}. Reports event-loop lag,
+end-to-end latency per command (from when the interaction was due until its
+last response) and lost writes: acknowledged quotes, edits or deletions the
+store doesn't reflect. With --verify the stores are closed and re-read from
+disk for that check. --cluster runs `main.py quote-server` in a subprocess
+and sends every quote operation over its socket.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import pathlib
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.common import BENCH_OWNER_ID, load_bot, max_rss_mb, summarize
+from benchmarks.corpus import WORDS, FIRST_NAMES, generate_quotes, write_corpus
+from benchmarks.fakes import FakeChannel, FakeGuild, FakeInteraction, FakeRest, FakeUser
+from quote_server import QuoteClient
+from quote_store import QuoteRegistry
+from scheduler import RateLimitScheduler
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Relative frequency of each command in synthetic traces
+COMMAND_MIX = {
+    "create": 30,
+    "add": 10,
+    "edit": 10,
+    "delete": 5,
+    "random": 15,
+    "daily": 5,
+    "mine": 10,
+    "search": 10,
+    "all": 5,
+}
+
+ADDED_RE = re.compile(r"^Quote #(\d+) added")
+UPDATED_RE = re.compile(r"^Quote #(\d+) updated")
+DELETED_RE = re.compile(r"^Quote #(\d+) deleted")
+
+
+# -------------------------------
+# Traces
+# -------------------------------
+def synthetic_trace(count, rate, guild_ids, corpus_size, seed=0, burst=False):
+    """Poisson arrivals at `rate` per second, or all at once with burst"""
+    rng = random.Random(seed)
+    names, weights = zip(*COMMAND_MIX.items())
+    events = []
+    t = 0.0
+    for n in range(count):
+        if not burst:
+            t += rng.expovariate(rate)
+        command = rng.choices(names, weights)[0]
+        user = rng.choice(FIRST_NAMES)
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+        options = {}
+        if command == "create":
+            options = {"quote": f"storm {n} {words}"}
+        elif command == "add":
+            options = {"messages": rng.randint(1, 3)}
+        elif command == "edit":
+            user = "owner"
+            options = {"quote_id": rng.randint(1, corpus_size), "new_text": f"edit {n} {words}"}
+        elif command == "delete":
+            user = "owner"
+            options = {"quote_id": rng.randint(1, corpus_size)}
+        elif command == "search":
+            options = {"query": words.split()[0]}
+        elif command == "all":
+            user = "owner"
+        events.append({
+            "t": round(t, 6),
+            "command": command,
+            "guild": rng.choice(guild_ids),
+            "user": user,
+            "options": options
+        })
+    return events
+
+
+def read_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda event: event["t"])
+
+
+def write_trace(path, events):
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+# -------------------------------
+# Acknowledgements
+# -------------------------------
+class Ledger:
+    """What the bot told users it did, to check against the store afterwards"""
+
+    def __init__(self):
+        self.created = {}
+        self.edits = defaultdict(set)
+        self.deleted = set()
+        self.duplicate_ids = 0
+
+    def record(self, event, interaction):
+        namespace = str(event["guild"])
+        for kind, content, _ in interaction.sent:
+            if not isinstance(content, str):
+                continue
+            if match := ADDED_RE.match(content):
+                key = (namespace, int(match.group(1)))
+                if key in self.created:
+                    # Two quotes acknowledged under one id: one of them is gone
+                    self.duplicate_ids += 1
+                text = event["options"].get("quote")
+                self.created[key] = text.strip() if text else None
+            elif match := UPDATED_RE.match(content):
+                self.edits[(namespace, int(match.group(1)))].add(event["options"]["new_text"].strip())
+            elif DELETED_RE.match(content):
+                self.deleted.add((namespace, event["options"]["quote_id"]))
+
+    async def lost_writes(self, get):
+        """Acknowledged changes missing from the store; get(namespace, id) -> quote"""
+        lost = Counter()
+        for (namespace, quote_id), text in self.created.items():
+            if (namespace, quote_id) in self.deleted:
+                continue
+            quote = await get(namespace, quote_id)
+            if quote is None:
+                lost["created"] += 1
+            elif text is not None and quote["text"] != text and quote["text"] not in self.edits.get((namespace, quote_id), ()):
+                lost["created_text"] += 1
+        for key, texts in self.edits.items():
+            if key in self.deleted:
+                continue
+            quote = await get(*key)
+            if quote is None or quote["text"] not in texts:
+                lost["edited"] += 1
+        for key in self.deleted:
+            if await get(*key) is not None:
+                lost["deleted"] += 1
+        lost["duplicate_ids"] = self.duplicate_ids
+        return dict(lost)
+
+
+# -------------------------------
+# Replay
+# -------------------------------
+async def monitor_loop_lag(samples, interval=0.01):
+    """How late the loop wakes up a sleeper: time it spends blocked elsewhere"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+class StandInGateway:
+    """Delivers trace events to the command callbacks, one task per interaction"""
+
+    def __init__(self, main, rest, guild_ids, ledger):
+        self.main = main
+        self.rest = rest
+        self.ledger = ledger
+        self.guilds = {guild_id: FakeGuild(guild_id) for guild_id in guild_ids}
+        self.channels = {guild_id: FakeChannel(guild) for guild_id, guild in self.guilds.items()}
+        self.users = {}
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.unanswered = Counter()
+
+    def user(self, name):
+        if name not in self.users:
+            self.users[name] = FakeUser(name, BENCH_OWNER_ID if name == "owner" else None)
+        return self.users[name]
+
+    def fill_channels(self, depth):
+        """Recent chat for /add to quote from"""
+        for channel in self.channels.values():
+            for n in range(depth):
+                author = self.user(FIRST_NAMES[n % len(FIRST_NAMES)])
+                self.main.message_buffer.add(channel.post(author, f"chat {n} {WORDS[n % len(WORDS)]}"))
+
+    async def _dispatch(self, event, due):
+        loop = asyncio.get_running_loop()
+        guild_id = event["guild"]
+        interaction = FakeInteraction(
+            self.user(event["user"]),
+            self.guilds[guild_id],
+            self.channels[guild_id],
+            rest=self.rest
+        )
+        command = getattr(self.main, f"{event['command']}_slash")
+        try:
+            await command.callback(interaction, **event["options"])
+        except Exception as e:
+            self.errors[f"{event['command']}: {type(e).__name__}: {e}"] += 1
+            return
+        self.latencies[event["command"]].append(loop.time() - due)
+        if not interaction.sent:
+            self.unanswered[event["command"]] += 1
+        self.ledger.record(event, interaction)
+
+    async def replay(self, events, speed=1.0):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tasks = []
+        for event in events:
+            due = start + event["t"] / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._dispatch(event, due)))
+        await asyncio.gather(*tasks)
+        return loop.time() - start
+
+
+def start_quote_server(socket_path):
+    env = dict(os.environ, QUOTE_SOCKET=str(socket_path))
+    server = subprocess.Popen([sys.executable, str(ROOT / "main.py"), "quote-server"], env=env)
+    deadline = time.monotonic() + 15
+    while not socket_path.exists():
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError("Quote server didn't start")
+        time.sleep(0.05)
+    return server
+
+
+async def run(args, directory):
+    main = load_bot(directory)
+    guild_ids = [300000000000000000 + n for n in range(args.guilds)]
+    for n, guild_id in enumerate(guild_ids):
+        write_corpus(main.QUOTE_DIR / f"{guild_id}.json", generate_quotes(args.corpus, seed=args.seed + n))
+
+    if args.trace:
+        events = read_trace(args.trace)
+    else:
+        events = synthetic_trace(args.count, args.rate, guild_ids, args.corpus, seed=args.seed, burst=args.burst)
+    if args.save_trace:
+        write_trace(args.save_trace, events)
+    guild_ids = sorted(set(guild_ids) | {event["guild"] for event in events})
+
+    server = None
+    if args.cluster:
+        socket_path = directory / "quotes.sock"
+        server = start_quote_server(socket_path)
+        main.quotes = QuoteClient(socket_path)
+
+    async def drop_presence(value, key=None):
+        pass
+    main.scheduler.close()
+    main.scheduler = RateLimitScheduler(drop_presence)
+
+    ledger = Ledger()
+    rest = FakeRest(args.rest_latency / 1000, args.rest_jitter / 1000, seed=args.seed)
+    gateway = StandInGateway(main, rest, guild_ids, ledger)
+    gateway.fill_channels(main.MESSAGE_BUFFER_DEPTH)
+
+    lag = []
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+    try:
+        # Handlers log every change; keep that out of the report
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            elapsed = await gateway.replay(events, speed=args.speed)
+    finally:
+        monitor.cancel()
+
+    report = {
+        "events": len(events),
+        "mode": "cluster" if args.cluster else "local",
+        "storage": main.QUOTE_STORAGE,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(events) / elapsed, 1) if elapsed else None,
+        "rest_calls": rest.calls,
+        "loop_lag": summarize(lag),
+        "latency": {name: summarize(samples) for name, samples in sorted(gateway.latencies.items())},
+        "errors": dict(gateway.errors),
+        "unanswered": dict(gateway.unanswered),
+        "acknowledged": {
+            "created": len(ledger.created),
+            "edited": len(ledger.edits),
+            "deleted": len(ledger.deleted)
+        },
+        "lost_writes": await ledger.lost_writes(main.quotes.get),
+    }
+
+    await main.quotes.close()
+    if server is not None:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    if args.verify:
+        # Everything acknowledged must have made it to disk
+        registry = QuoteRegistry(main.QUOTE_DIR, kind=main.QUOTE_STORAGE)
+
+        async def get_from_disk(namespace, quote_id):
+            return registry.store(namespace).get(quote_id)
+        report["lost_on_disk"] = await ledger.lost_writes(get_from_disk)
+        registry.close()
+
+    report["max_rss_mb"] = max_rss_mb()
+    return report
+
+
+def print_report(report):
+    lag = report["loop_lag"]
+    print(f"{report['events']} interactions in {report['elapsed_s']} s ({report['mode']}, {report['storage']})")
+    if lag["count"]:
+        print(f"Loop lag       p50 {lag['p50_ms']:>9.3f} ms  p99 {lag['p99_ms']:>9.3f} ms  max {lag['max_ms']:>9.3f} ms")
+    for name, stats in report["latency"].items():
+        print(f"{name:<14} p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  max {stats['max_ms']:>9.3f} ms  n={stats['count']}")
+    for error, count in report["errors"].items():
+        print(f"ERROR x{count}: {error}")
+    print(f"Acknowledged: {report['acknowledged']}")
+    print(f"Lost writes: {report['lost_writes']}")
+    if "lost_on_disk" in report:
+        print(f"Lost on disk: {report['lost_on_disk']}")
+
+
+def failed(report):
+    lost = sum(report["lost_writes"].values()) + sum(report.get("lost_on_disk", {}).values())
+    return bool(lost or report["errors"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000, help="interactions in a synthetic trace")
+    parser.add_argument("--rate", type=float, default=100.0, help="average interactions per second")
+    parser.add_argument("--burst", action="store_true", help="deliver every interaction at once")
+    parser.add_argument("--trace", help="replay this JSON-lines trace instead of a synthetic one")
+    parser.add_argument("--save-trace", help="write the trace that was replayed to this file")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--corpus", type=int, default=1000, help="quotes per guild before the storm")
+    parser.add_argument("--rest-latency", type=float, default=50.0, help="fake REST round trip in ms")
+    parser.add_argument("--rest-jitter", type=float, default=20.0, help="± ms on each round trip")
+    parser.add_argument("--cluster", action="store_true", help="go through a quote-server subprocess")
+    parser.add_argument("--verify", action="store_true", help="re-read the stores from disk and check every acknowledged change")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="qred-load-") as tmp:
+        report = asyncio.run(run(args, pathlib.Path(tmp)))
+
+    print_report(report)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.save}")
+    if failed(report):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
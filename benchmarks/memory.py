@@ -0,0 +1,79 @@
+"""Compares the memory of quotes held as JSON dicts against Quote records
+
+Loads the same synthetic quotes.json both ways and reports what the loaded
+quotes take (tracemalloc), plus the cost of a date-range query on each:
+
+    python -m benchmarks.memory --size 1m
+"""
+import argparse
+import functools
+import gc
+import json
+import pathlib
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.corpus import generate_quotes, parse_size, write_corpus
+from quote_store import DATE_FORMAT, InternTable, Quote, day_ordinal
+
+
+def traced_load(path, object_hook=None):
+    """(quotes, bytes they hold) for quotes.json decoded with object_hook"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            quotes = json.load(f, object_hook=object_hook)
+        gc.collect()
+        return quotes, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def time_range(quotes, start, end, in_range):
+    began = time.perf_counter()
+    matches = sum(1 for q in quotes if in_range(q, start, end))
+    return matches, time.perf_counter() - began
+
+
+def dict_in_range(quote, start, end):
+    return start <= datetime.strptime(quote["date"], DATE_FORMAT) <= end
+
+
+def record_in_range(quote, first, last):
+    return type(quote.day) is int and first <= quote.day <= last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1m", help="number of quotes, e.g. 100k or 1m")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    size = parse_size(args.size)
+
+    with tempfile.TemporaryDirectory(prefix="qred-memory-") as tmp:
+        path = pathlib.Path(tmp) / "quotes.json"
+        write_corpus(path, generate_quotes(size, seed=args.seed))
+        print(f"{size} quotes, {path.stat().st_size / 2 ** 20:.1f} MiB of JSON")
+
+        dicts, dict_bytes = traced_load(path)
+        interned = InternTable()
+        records, record_bytes = traced_load(path, functools.partial(Quote.from_dict, interned=interned))
+
+    assert [q.to_dict() for q in records[:1000]] == dicts[:1000], "Quote records didn't round-trip"
+
+    print(f"dicts          {dict_bytes / 2 ** 20:>9.1f} MiB  {dict_bytes / size:>7.1f} B/quote")
+    print(f"Quote records  {record_bytes / 2 ** 20:>9.1f} MiB  {record_bytes / size:>7.1f} B/quote")
+    print(f"saved          {(dict_bytes - record_bytes) / 2 ** 20:>9.1f} MiB  ({1 - record_bytes / dict_bytes:.0%}), {len(interned)} distinct authors")
+
+    start, end = datetime(2021, 1, 1), datetime(2022, 6, 30)
+    matches, dict_seconds = time_range(dicts, start, end, dict_in_range)
+    record_matches, record_seconds = time_range(records, day_ordinal(start), day_ordinal(end), record_in_range)
+    assert matches == record_matches
+    print(f"date range     dicts {dict_seconds * 1000:.1f} ms, records {record_seconds * 1000:.1f} ms ({matches} matches)")
+
+
+if __name__ == "__main__":
+    main()
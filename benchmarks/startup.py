@@ -0,0 +1,87 @@
+"""Compares cold-start time of the JSON and binary snapshot storage
+
+Writes the same synthetic corpus as quotes.json and as a .snap snapshot,
+then loads each in a fresh interpreter (so nothing is cached or interned
+already) and reports how long until the store is usable, how long the first
+status pick and first search take after that (the snapshot store builds its
+search index in the background, so the first search may wait for it), and
+peak RSS after loading and overall:
+
+    python -m benchmarks.startup --sizes 100k,1m
+"""
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import max_rss_mb
+from benchmarks.corpus import generate_quotes, parse_size, write_corpus
+from quote_store import QuoteStore, open_backend, read_json_for_import, write_snapshot
+
+KINDS = ("json", "snapshot")
+
+
+def child(kind, path):
+    """Runs in the fresh interpreter: load the store and time the first reads"""
+    start = time.perf_counter()
+    store = QuoteStore(open_backend(kind, path))
+    loaded = time.perf_counter()
+    load_rss = max_rss_mb()
+    store.status_text(store.status_quote_at(len(store) // 2))
+    first_status = time.perf_counter()
+    store.search("kawa prawda")
+    first_search = time.perf_counter()
+    print(json.dumps({
+        "quotes": len(store),
+        "load_s": round(loaded - start, 4),
+        "first_status_ms": round((first_status - loaded) * 1000, 3),
+        "first_search_s": round(first_search - first_status, 4),
+        "load_rss_mb": load_rss,
+        "max_rss_mb": max_rss_mb(),
+    }))
+
+
+def measure(kind, path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", kind, str(path)],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100k,1m", help="corpus sizes, e.g. 100k,1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--child", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child(*args.child)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="qred-startup-") as tmp:
+        for size in (parse_size(size) for size in args.sizes.split(",")):
+            path = pathlib.Path(tmp) / f"{size}.json"
+            write_corpus(path, generate_quotes(size, seed=args.seed))
+            write_snapshot(path.with_suffix(".snap"), *read_json_for_import(path))
+            results[str(size)] = {}
+            for kind in KINDS:
+                stats = results[str(size)][kind] = measure(kind, path)
+                print(
+                    f"{size:>9} {kind:<9} load {stats['load_s']:>8.3f} s  first status {stats['first_status_ms']:>8.3f} ms  "
+                    f"first search {stats['first_search_s']:>7.3f} s  rss {stats['load_rss_mb']:>7.1f} / {stats['max_rss_mb']:>7.1f} MiB"
+                )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,26 @@
+import aiohttp
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
-import json
 import os
 from datetime import datetime
 import pathlib
-import hashlib
-import re
+import argparse
 import asyncio
+import hashlib
+import json
+import logging
 import random
+import sys
+import tempfile
+import time
+from collections import Counter, OrderedDict, deque
+from quote_store import QuoteRegistry, legacy_files, migrate_to_namespace, read_meta, seconds_until_midnight, write_json_atomic
+from metrics import METRICS, RateLimitLogCounter, SlowCallProfiler, monitor_loop_lag, serve_prometheus
+from quote_server import LocalQuotes, QuoteClient, serve
+from quote_io import FORMATS, IMPORT_BATCH_SIZE, decode_lines, export_quotes, file_lines, format_for, import_quotes
+from scheduler import RateLimitScheduler
 
 # -------------------------------
 # Load environment
@@ -16,61 +28,159 @@ import random
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 OWNER_ID = int(os.getenv("OWNER_ID"))
-QUOTE_FILE = pathlib.Path(__file__).parent / "quotes.json"
+# Quotes are kept per guild in QUOTE_DIR/<guild id>.json; DMs get dm-<user id>.json
+QUOTE_DIR = pathlib.Path(os.getenv("QUOTE_DIR", pathlib.Path(__file__).parent / "quotes"))
+# Pre-namespace single-file storage, moved into DEFAULT_NAMESPACE on startup
+QUOTE_FILE = pathlib.Path(os.getenv("QUOTE_FILE", pathlib.Path(__file__).parent / "quotes.json"))
+# The guild QUOTE_FILE belongs to; it is left alone until this is set
+DEFAULT_NAMESPACE = os.getenv("DEFAULT_GUILD_ID")
+# Whose quotes the bot status shows
+STATUS_NAMESPACE = os.getenv("STATUS_GUILD_ID", DEFAULT_NAMESPACE or "default")
+# Guild quotes unused for this long are dropped from memory
+NAMESPACE_IDLE_SECONDS = int(os.getenv("NAMESPACE_IDLE_SECONDS", 1800))
+# /random avoids repeats per "user" or per "guild"; RANDOM_RECENT_BIAS (0-1) favours newer quotes
+RANDOM_BAG_SCOPE = os.getenv("RANDOM_BAG_SCOPE", "user")
+RANDOM_RECENT_BIAS = float(os.getenv("RANDOM_RECENT_BIAS", 0.0))
+# "json" rewrites <namespace>.json on every change, "journal" appends to <namespace>.journal,
+# "sqlite" keeps quotes in <namespace>.db and "snapshot" in a memory-mapped binary
+# <namespace>.snap (both migrated from the .json on first start)
+QUOTE_STORAGE = os.getenv("QUOTE_STORAGE", "json")
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", 1024 * 1024))
+# Changes are written in the background, at most FLUSH_DELAY seconds after
+# the first unsaved change or as soon as FLUSH_MAX_PENDING changes pile up
+FLUSH_DELAY = float(os.getenv("FLUSH_DELAY", 2.0))
+FLUSH_MAX_PENDING = int(os.getenv("FLUSH_MAX_PENDING", 50))
+# Recent non-bot messages kept per channel for /add, and the total memory they may use
+MESSAGE_BUFFER_DEPTH = int(os.getenv("MESSAGE_BUFFER_DEPTH", 100))
+MESSAGE_BUFFER_MAX_BYTES = int(os.getenv("MESSAGE_BUFFER_MAX_BYTES", 4 * 1024 * 1024))
+# Rendered quote messages and embed pages kept for reuse
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 4096))
+# How far back /add may page through history when the buffer doesn't reach
+ADD_HISTORY_LIMIT = int(os.getenv("ADD_HISTORY_LIMIT", 500))
+# Gateway shards: SHARD_COUNT unset lets Discord recommend one; SHARD_IDS="0,1" runs only those
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(i) for i in os.getenv("SHARD_IDS").split(",")] if os.getenv("SHARD_IDS") else None
+# Cluster mode: bot processes share the quotes of `python main.py quote-server` on this Unix socket
+QUOTE_SOCKET = os.getenv("QUOTE_SOCKET")
+# Prometheus text metrics on http://127.0.0.1:METRICS_PORT/metrics (off when unset)
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+# Share of interactions run under cProfile; those slower than PROFILE_SLOW_MS are kept in PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", 500))
+PROFILE_DIR = pathlib.Path(__file__).parent / "profiles"
+# Fingerprint of the last command tree synced to Discord; startup skips the sync while it matches
+COMMAND_SYNC_FILE = pathlib.Path(os.getenv("COMMAND_SYNC_FILE", pathlib.Path(__file__).parent / "command_sync.json"))
 
 # -------------------------------
 # Discord bot setup
 # -------------------------------
+def open_registry():
+    backend_options = {"compact_threshold": JOURNAL_COMPACT_BYTES} if QUOTE_STORAGE == "journal" else {}
+    registry = QuoteRegistry(
+        QUOTE_DIR,
+        kind=QUOTE_STORAGE,
+        backend_options=backend_options,
+        writer_options={"delay": FLUSH_DELAY, "max_pending": FLUSH_MAX_PENDING},
+        recent_bias=RANDOM_RECENT_BIAS,
+        shard_count=SHARD_COUNT or 1
+    )
+    if DEFAULT_NAMESPACE:
+        migrate_to_namespace(QUOTE_FILE, registry.shard_path(DEFAULT_NAMESPACE))
+    elif legacy_files(QUOTE_FILE):
+        # Moving them to a namespace no guild reads would make them vanish from every command
+        print("=" * 72)
+        print(f"WARNING: {', '.join(legacy_files(QUOTE_FILE))} in {QUOTE_FILE.parent} predate per-server quotes")
+        print("and were NOT migrated, so no server can see them. Set DEFAULT_GUILD_ID to")
+        print("the id of the server they belong to and restart the bot.")
+        print("=" * 72)
+    return registry
+
+# Command handlers only talk to `quotes`: in-process, or the shared quote server
+quotes = QuoteClient(QUOTE_SOCKET) if QUOTE_SOCKET else LocalQuotes(open_registry())
+
+class QredBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        # Runs once per process, unlike on_ready which fires again after reconnects
+        await sync_commands_if_changed()
+        
+        global daily_task, eviction_task, lag_task, metrics_server
+        daily_task = asyncio.create_task(daily_rotation_loop())
+        eviction_task = asyncio.create_task(namespace_eviction_loop())
+        lag_task = asyncio.create_task(monitor_loop_lag())
+        if METRICS_PORT:
+            try:
+                metrics_server = await serve_prometheus(METRICS_PORT)
+            except OSError as e:
+                print(f"Failed to start metrics endpoint: {e}")
+    
+    async def close(self):
+        for session in rave_sessions.values():
+            session.stop()
+        rave_sessions.clear()
+        for task in (daily_task, eviction_task, lag_task):
+            if task:
+                task.cancel()
+        if metrics_server:
+            metrics_server.close()
+        scheduler.close()
+        await quotes.close()
+        await super().close()
+
+class QredTree(app_commands.CommandTree):
+    """Times every slash command, sampling some into the profiler"""
+    
+    async def interaction_check(self, interaction):
+        if interaction.type is discord.InteractionType.autocomplete:
+            # Never reaches a command completion that would finish the timing
+            return True
+        interaction.extras["started"] = time.perf_counter()
+        interaction.extras["profile"] = profiler.start()
+        return True
+    
+    async def on_error(self, interaction, error):
+        finish_command(interaction, failed=True)
+        await super().on_error(interaction, error)
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix=commands.when_mentioned, intents=intents)
+bot = QredBot(
+    command_prefix=commands.when_mentioned,
+    intents=intents,
+    tree_cls=QredTree,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS
+)
 
-# Rave mode state
-rave_mode_active = False
-rave_task = None
-annoy_user_id = None
+# Active rave sessions by channel id (None for the status-only DM rave)
+rave_sessions = {}
+RAVE_INTERVAL = 5
 
-# -------------------------------
-# Helper functions
-# -------------------------------
-def load_quotes():
-    if QUOTE_FILE.exists():
-        try:
-            with open(QUOTE_FILE, "r", encoding="utf-8") as f:
-                quotes = json.load(f)
-                needs_save = False
-                next_id = max([q.get("id", 0) for q in quotes], default=0) + 1
-                for q in quotes:
-                    if "id" not in q:
-                        q["id"] = next_id
-                        next_id += 1
-                        needs_save = True
-                if needs_save:
-                    save_quotes(quotes)
-                return quotes
-        except json.JSONDecodeError as e:
-            print(f"Error loading quotes: {e}")
-            return []
-    return []
-
-def save_quotes(quotes):
-    try:
-        with open(QUOTE_FILE, "w", encoding="utf-8") as f:
-            json.dump(quotes, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving quotes: {e}")
+# Rotates the status to the new daily quote at midnight
+daily_task = None
+# Drops idle guild quotes from memory
+eviction_task = None
+# Samples event loop lag into the metrics
+lag_task = None
+metrics_server = None
+
+profiler = SlowCallProfiler(PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, slow_seconds=PROFILE_SLOW_MS / 1000)
+# discord.py retries rate-limited requests itself and only logs a warning
+logging.getLogger("discord.http").addHandler(RateLimitLogCounter())
 
-def get_next_id(quotes):
-    if not quotes:
-        return 1
-    return max([q.get("id", 0) for q in quotes]) + 1
+# Id of the quote currently shown in the bot status (cursor for /cycle)
+status_quote_id = None
 
-def find_quote_by_id(quotes, quote_id):
-    for q in quotes:
-        if q.get("id") == quote_id:
-            return q
-    return None
+# Discord allows 6000 characters and 25 fields per embed; keep headroom for title/footer
+EMBED_CHAR_BUDGET = 5500
+EMBED_MAX_FIELDS = 25
+# Upload limit where there's no guild to ask (DMs)
+EXPORT_FILESIZE_LIMIT = 10 * 1024 * 1024
+# Bytes read from an /import attachment at a time
+IMPORT_CHUNK_SIZE = 64 * 1024
 
+# -------------------------------
+# Helper functions
+# -------------------------------
 def format_author_name(name):
     return name.strip()
 
@@ -90,140 +200,592 @@ def categorize_author(count):
     else:
         return "Marcus Aurelius"
 
-def clean_quote_text(text):
-    """Remove Discord mentions and clean text for status"""
-    # Remove user mentions <@123456789> or <@!123456789>
-    text = re.sub(r'<@!?\d+>', '', text)
-    # Remove role mentions <@&123456789>
-    text = re.sub(r'<@&\d+>', '', text)
-    # Remove channel mentions <#123456789>
-    text = re.sub(r'<#\d+>', '', text)
-    # Clean up extra spaces
-    text = ' '.join(text.split())
-    return text.strip()
-
-def get_daily_quote_index(quotes):
-    if not quotes:
-        return 0
-    
-    today = datetime.now().strftime("%Y-%m-%d")
-    hash_obj = hashlib.md5(today.encode())
-    hash_int = int(hash_obj.hexdigest(), 16)
-    
-    return hash_int % len(quotes)
-
-def can_modify_quote(interaction, quote, owner_id):
+def namespace_for(interaction):
+    """Quotes are kept per guild; each DM user gets their own namespace"""
+    if interaction.guild_id:
+        return str(interaction.guild_id)
+    return f"dm-{interaction.user.id}"
+
+async def can_modify_quote(interaction, namespace, quote, owner_id):
     """Check if user can modify this quote"""
     if interaction.user.id == owner_id:
         return True
     
-    author_names = [a.strip() for a in quote["author"].split(",")]
-    return interaction.user.name in author_names
-
-def get_valid_status_quotes(quotes):
-    """Filter quotes that fit in status (max 128 chars after cleaning)"""
-    valid = []
-    for q in quotes:
-        cleaned_text = clean_quote_text(q["text"])
-        status_text = f'"{cleaned_text}" - {q["author"]}'
-        if len(status_text) <= 128:
-            valid.append(q)
-    return valid
+    return await quotes.is_author(namespace, quote["id"], interaction.user.name)
 
-async def set_status_to_quote(quote):
-    """Set bot status to a specific quote"""
-    cleaned_text = clean_quote_text(quote["text"])
-    status_text = f'"{cleaned_text}" - {quote["author"]}'
-    
+async def send_presence(status_text, shard_id=None):
     await bot.change_presence(
         activity=discord.Activity(
             type=discord.ActivityType.watching,
             name=status_text
-        )
+        ),
+        shard_id=shard_id
     )
-    print(f"Status set to: {status_text}")
+    print(f"Status set to: {status_text} (shard {shard_id if shard_id is not None else 'all'})")
+
+# All presence updates and rave messages go through the scheduler
+scheduler = RateLimitScheduler(send_presence)
+
+def scheduler_counters():
+    counters = [("presence_coalesced_total", {}, scheduler.presence_coalesced)]
+    counters += [("scheduler_deferred_total", {"route": kind}, n) for kind, n in scheduler.deferred.items()]
+    counters += [("scheduler_dropped_total", {"route": kind}, n) for kind, n in scheduler.dropped.items()]
+    return counters
+
+METRICS.add_collector(scheduler_counters)
+
+def update_status(status_text, shard_id=None):
+    """Queue a status change for one shard, or for every shard"""
+    if shard_id is not None:
+        scheduler.update_presence(status_text, shard_id)
+    elif bot.shards:
+        for shard in bot.shards:
+            scheduler.update_presence(status_text, shard)
+    else:
+        scheduler.update_presence(status_text)
+
+def set_status_to_quote(pick, shard_id=None):
+    """Set bot status to a {"quote", "status_text"} pick (sent once the presence rate limit allows)"""
+    global status_quote_id
+    
+    # /cycle only moves through the status namespace, which is what shard-wide statuses show
+    if shard_id is None:
+        status_quote_id = pick["quote"]["id"]
+    update_status(pick["status_text"], shard_id)
+
+class ShardStats:
+    """Per-shard event counts over a sliding window of one-second buckets"""
+    
+    def __init__(self, window=60):
+        self.window = window
+        self.totals = Counter()
+        self._buckets = {}
+    
+    def record(self, shard_id):
+        now = int(time.monotonic())
+        self.totals[shard_id] += 1
+        buckets = self._buckets.setdefault(shard_id, deque())
+        if buckets and buckets[-1][0] == now:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([now, 1])
+        while buckets[0][0] <= now - self.window:
+            buckets.popleft()
+    
+    def per_minute(self, shard_id):
+        cutoff = int(time.monotonic()) - self.window
+        count = sum(n for second, n in self._buckets.get(shard_id, ()) if second > cutoff)
+        return count * 60 / self.window
+
+shard_stats = ShardStats()
+
+def shard_of(guild):
+    """Shard an event from guild arrived on (DMs come in on shard 0)"""
+    return guild.shard_id if guild else 0
+
+def format_quote_message(quote):
+    return f'#{quote["id"]}: "{quote["text"]}" - {quote["author"]} ({quote["date"]})'
 
 def format_rave_message(quote):
     """Format quote message for rave mode (simple text, no embeds)"""
     return f'**RAVE MODE** 🎉\n"{quote["text"]}" - {quote["author"]} (#{quote["id"]})'
 
-async def rave_mode_loop(channel_to_spam=None):
-    """Main rave mode loop - cycles quotes every 5 seconds"""
-    global rave_mode_active, annoy_user_id
-    
-    quotes = load_quotes()
-    valid_quotes = get_valid_status_quotes(quotes)
-    
-    if not valid_quotes:
-        valid_quotes = quotes  # Fallback to all quotes
-    
-    index = 0
-    
-    while rave_mode_active:
-        try:
-            quote = valid_quotes[index % len(valid_quotes)]
-            
-            # Update status
-            await set_status_to_quote(quote)
-            
-            # Send message to channel if provided
-            if channel_to_spam:
-                message_text = format_rave_message(quote)
+class RaveSession:
+    """One rave: cycles quotes into the status and, in a guild, into a channel"""
+    
+    def __init__(self, namespace, channel=None, annoy_user_id=None, interval=RAVE_INTERVAL):
+        self.namespace = namespace
+        self.channel = channel
+        self.annoy_user_id = annoy_user_id
+        self.interval = interval
+        self.route = f"channel:{channel.id}" if channel else None
+        # Guild raves only take over the status of the shard serving that guild
+        self.shard_id = channel.guild.shard_id if channel else None
+        self.task = None
+    
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+    
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.route:
+            scheduler.forget(self.route)
+    
+    async def _run(self):
+        index = 0
+        
+        while True:
+            try:
+                # Falls back to all quotes when none fit in the status
+                pick = await quotes.status_pick(self.namespace, index)
+                if pick is None:
+                    await asyncio.sleep(self.interval)
+                    continue
+                quote = pick["quote"]
                 
-                # Add ping if set
-                if annoy_user_id == "everyone":
-                    message_text = f"@everyone\n{message_text}"
-                elif annoy_user_id:
-                    message_text = f"<@{annoy_user_id}>\n{message_text}"
+                # Update status
+                set_status_to_quote(pick, self.shard_id)
                 
-                await channel_to_spam.send(message_text)
-            
-            index += 1
-            await asyncio.sleep(5)
+                # Send message to channel if provided
+                if self.channel:
+                    message_text = render_quote("rave", self.namespace, quote, format_rave_message)
+                    
+                    # Add ping if set
+                    if self.annoy_user_id == "everyone":
+                        message_text = f"@everyone\n{message_text}"
+                    elif self.annoy_user_id:
+                        message_text = f"<@{self.annoy_user_id}>\n{message_text}"
+                    
+                    # A message that can't go out before the next tick is dropped
+                    await scheduler.send(
+                        self.route,
+                        lambda: self.channel.send(message_text),
+                        max_wait=self.interval
+                    )
+                
+                index += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Rave mode error: {e}")
             
+            await asyncio.sleep(self.interval)
+
+async def show_daily_status(shard_ids=(None,)):
+    """Put today's status quote in the bot status of shard_ids (None meaning every shard)"""
+    if not shard_ids:
+        return
+    pick = await quotes.daily_status(STATUS_NAMESPACE)
+    for shard_id in shard_ids:
+        if pick:
+            set_status_to_quote(pick, shard_id)
+        else:
+            update_status("Tracking your quotes | /commands", shard_id)
+
+def shards_without_rave(shard_ids=None):
+    """Those of shard_ids (default: every shard) whose status no rave is cycling; [None] means all"""
+    busy = {session.shard_id for session in rave_sessions.values()}
+    if None in busy:
+        # The DM rave cycles every shard's status
+        return []
+    if shard_ids is None:
+        if not busy:
+            return [None]
+        shard_ids = bot.shards
+    return [shard_id for shard_id in shard_ids if shard_id not in busy]
+
+async def daily_rotation_loop():
+    """Switch the status to the new daily quote at every local midnight"""
+    while True:
+        # A second of slack so the clock is safely past midnight
+        await asyncio.sleep(seconds_until_midnight() + 1)
+        try:
+            await show_daily_status(shards_without_rave())
         except Exception as e:
-            print(f"Rave mode error: {e}")
-            await asyncio.sleep(5)
+            print(f"Daily status error: {e}")
 
-# -------------------------------
-# Events
-# -------------------------------
-@bot.event
-async def on_ready():
-    print(f"Bot logged in as {bot.user}")
-    
-    # List all registered commands BEFORE sync
+async def namespace_eviction_loop():
+    """Periodically drop quotes of guilds that have been idle from memory"""
+    while True:
+        await asyncio.sleep(max(60, NAMESPACE_IDLE_SECONDS // 4))
+        keep = {STATUS_NAMESPACE} | {session.namespace for session in rave_sessions.values()}
+        try:
+            await quotes.evict(NAMESPACE_IDLE_SECONDS, keep=keep)
+        except Exception as e:
+            print(f"Namespace eviction error: {e}")
+
+async def defer(interaction, **kwargs):
+    """Defer an interaction, noting when for the defer -> followup metric"""
+    await interaction.response.defer(**kwargs)
+    interaction.extras["deferred"] = time.perf_counter()
+
+def finish_command(interaction, failed=False):
+    """Record a finished slash command's latency (and profile, if it was sampled)"""
+    started = interaction.extras.pop("started", None)
+    if started is None:
+        return
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    now = time.perf_counter()
+    METRICS.observe("command_duration_seconds", now - started, command=name)
+    if failed:
+        METRICS.inc("command_errors_total", command=name)
+    deferred = interaction.extras.pop("deferred", None)
+    if deferred is not None:
+        METRICS.observe("defer_to_followup_seconds", now - deferred, command=name)
+    profiler.finish(interaction.extras.pop("profile", None), name, now - started)
+
+def command_fingerprint():
+    """Stable hash of the command tree as it is sent to Discord (names, descriptions, options)"""
+    payload = []
+    for command in sorted(bot.tree.get_commands(), key=lambda c: c.name):
+        try:
+            payload.append(command.to_dict(bot.tree))
+        except TypeError:
+            # discord.py < 2.4 takes no tree argument
+            payload.append(command.to_dict())
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def remember_command_sync(fingerprint):
+    try:
+        write_json_atomic(COMMAND_SYNC_FILE, {
+            "fingerprint": fingerprint,
+            "application_id": bot.application_id,
+            "synced_at": datetime.now().isoformat(timespec="seconds")
+        })
+    except Exception as e:
+        print(f"Error saving command sync state: {e}")
+
+async def sync_commands_if_changed():
+    """Sync the global command tree only if it changed since the last sync"""
     print(f"Commands registered: {[cmd.name for cmd in bot.tree.get_commands()]}")
+    fingerprint = command_fingerprint()
+    state = read_meta(COMMAND_SYNC_FILE)
+    if state.get("fingerprint") == fingerprint and state.get("application_id") == bot.application_id:
+        print("Command tree unchanged since the last sync, skipping it")
+        return
     
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} slash commands")
         print(f"Command names: {[cmd.name for cmd in synced]}")
+        remember_command_sync(fingerprint)
     except Exception as e:
         print(f"Failed to sync commands: {e}")
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds >= 0.01 else f"{seconds * 1000:.1f} ms"
+
+def truncate(text, limit):
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+class MessageBuffer:
+    """Ring buffer of recent non-bot messages per channel, fed by on_message
     
-    quotes = load_quotes()
-    if quotes:
-        valid_quotes = get_valid_status_quotes(quotes)
+    Each channel keeps at most `depth` messages. When the estimated size of
+    all buffered messages passes `max_bytes`, the least recently active
+    channels are dropped first.
+    """
+    
+    def __init__(self, depth=100, max_bytes=4 * 1024 * 1024):
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._channels = OrderedDict()
+        self._bytes = 0
+    
+    @staticmethod
+    def _size(message):
+        # Content plus a rough allowance for the message object itself
+        return len(message.content) + 256
+    
+    def add(self, message):
+        buffer = self._channels.get(message.channel.id)
+        if buffer is None:
+            buffer = self._channels[message.channel.id] = deque()
+        else:
+            self._channels.move_to_end(message.channel.id)
+        
+        buffer.append(message)
+        self._bytes += self._size(message)
+        if len(buffer) > self.depth:
+            self._bytes -= self._size(buffer.popleft())
+        self._evict()
+    
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._channels) > 1:
+            _, buffer = self._channels.popitem(last=False)
+            self._bytes -= sum(self._size(msg) for msg in buffer)
+    
+    def replace(self, message):
+        """Swap in the edited version of a buffered message"""
+        buffer = self._channels.get(message.channel.id, ())
+        for i, msg in enumerate(buffer):
+            if msg.id == message.id:
+                self._bytes += self._size(message) - self._size(msg)
+                buffer[i] = message
+                return
+    
+    def remove(self, channel_id, message_id):
+        buffer = self._channels.get(channel_id, ())
+        for msg in buffer:
+            if msg.id == message_id:
+                buffer.remove(msg)
+                self._bytes -= self._size(msg)
+                return
+    
+    def recent(self, channel_id, count):
+        """Up to count buffered messages, newest first"""
+        buffer = self._channels.get(channel_id, ())
+        result = []
+        for msg in reversed(buffer):
+            if len(result) >= count:
+                break
+            result.append(msg)
+        return result
+    
+    def merge(self, channel_id, messages):
+        """Backfill a channel with messages fetched from history"""
+        buffer = self._channels.get(channel_id, ())
+        by_id = {msg.id: msg for msg in messages}
+        by_id.update((msg.id, msg) for msg in buffer)
+        merged = sorted(by_id.values(), key=lambda msg: msg.id)[-self.depth:]
         
-        if valid_quotes:
-            index = get_daily_quote_index(valid_quotes)
-            daily_quote = valid_quotes[index]
-            await set_status_to_quote(daily_quote)
+        self._bytes -= sum(self._size(msg) for msg in buffer)
+        self._channels[channel_id] = deque(merged)
+        self._channels.move_to_end(channel_id)
+        self._bytes += sum(self._size(msg) for msg in merged)
+        self._evict()
+
+message_buffer = MessageBuffer(depth=MESSAGE_BUFFER_DEPTH, max_bytes=MESSAGE_BUFFER_MAX_BYTES)
+
+class RenderCache:
+    """LRU of rendered quote messages and embed pages
+
+    Keys name what an entry was rendered from, including each quote's id
+    and text. The text is the quote's version (only /edit changes a quote),
+    so an edit made elsewhere, like another bot process, misses rather than
+    serving stale output. /edit and /delete also drop the quote's entries
+    right away. Cached embeds are shared, so they must not be modified.
+    """
+    
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # (namespace, quote id) -> keys of the entries showing that quote
+        self._by_quote = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, refs, render):
+        """Cached value for key, or render() it and remember which quotes (refs) it shows"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = render()
+        if self.max_entries > 0:
+            self._entries[key] = (value, refs)
+            for ref in refs:
+                self._by_quote.setdefault(ref, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (_, old_refs) = self._entries.popitem(last=False)
+                self._unlink(old_key, old_refs)
+        return value
+    
+    def _unlink(self, key, refs):
+        for ref in refs:
+            keys = self._by_quote.get(ref)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_quote[ref]
+    
+    def invalidate(self, namespace, quote_id):
+        """Drop everything showing a quote"""
+        for key in self._by_quote.pop((namespace, quote_id), ()):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry[1])
+    
+    def __len__(self):
+        return len(self._entries)
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+def render_cache_counters():
+    return [
+        ("render_cache_hits_total", {}, render_cache.hits),
+        ("render_cache_misses_total", {}, render_cache.misses),
+    ]
+
+METRICS.add_collector(render_cache_counters)
+METRICS.describe("render_cache_hits_total", "Quote messages and embed pages served from the render cache")
+METRICS.describe("render_cache_misses_total", "Quote messages and embed pages that had to be rendered")
+
+def render_quote(kind, namespace, quote, render):
+    """render(quote) through the cache, for output that shows a single quote"""
+    return render_cache.get(
+        (kind, namespace, quote["id"], quote["text"]),
+        ((namespace, quote["id"]),),
+        lambda: render(quote)
+    )
+
+async def fetch_recent_messages(channel, count):
+    """Page through channel history until count non-bot messages are found"""
+    found = []
+    async for msg in channel.history(limit=ADD_HISTORY_LIMIT):
+        if not msg.author.bot:
+            found.append(msg)
+            if len(found) >= count:
+                break
+    message_buffer.merge(channel.id, found)
+    return found
+
+# -------------------------------
+# Views
+# -------------------------------
+class QuotePageView(discord.ui.View):
+    """Paginated quote list - each page is fetched and rendered only when navigated to"""
+    
+    # Quotes fetched at a time as pages are navigated to
+    FETCH_SIZE = 100
+    
+    def __init__(self, user_id, fetch, total, title, format_field, description=None, timeout=180, cache_key=None):
+        super().__init__(timeout=timeout)
+        self.user_id = user_id
+        # fetch(after_id, limit) -> the next quotes in id order
+        self.fetch = fetch
+        self.total = total
+        # Fetched so far, in id order
+        self.quotes = []
+        self.exhausted = False
+        self.title = title
+        self.description = description
+        self.format_field = format_field
+        # (kind, namespace) to share rendered pages through render_cache, None to skip it
+        self.cache_key = cache_key
+        self.page = 0
+        # Pages are packed greedily by character budget, so their start
+        # offsets are only known once the previous page has been rendered
+        self.page_starts = [0]
+        self.message = None
+    
+    async def fetch_through(self, end):
+        """Fetch quotes until there are at least end of them, or no more"""
+        while len(self.quotes) < end and not self.exhausted:
+            after_id = self.quotes[-1]["id"] if self.quotes else 0
+            batch = await self.fetch(after_id, self.FETCH_SIZE)
+            self.quotes.extend(batch)
+            self.exhausted = len(batch) < self.FETCH_SIZE
+    
+    async def render(self):
+        start = self.page_starts[self.page]
+        # One past the longest possible page, to know whether there is a next one
+        await self.fetch_through(start + EMBED_MAX_FIELDS + 1)
+        if self.cache_key is None:
+            embed, index = self._render_page(start)
         else:
-            await bot.change_presence(
-                activity=discord.Activity(
-                    type=discord.ActivityType.watching,
-                    name="Tracking your quotes | /commands"
-                )
-            )
-    else:
-        await bot.change_presence(
-            activity=discord.Activity(
-                type=discord.ActivityType.watching,
-                name="Tracking your quotes | /commands"
+            # A page can only show quotes from start to start + EMBED_MAX_FIELDS
+            candidates = self.quotes[start:start + EMBED_MAX_FIELDS]
+            kind, namespace = self.cache_key
+            embed, index = render_cache.get(
+                (kind, namespace, self.title, self.description, self.page, start, self.total,
+                 tuple((q["id"], q["text"]) for q in candidates)),
+                tuple((namespace, q["id"]) for q in candidates),
+                lambda: self._render_page(start)
             )
-        )
+        
+        if self.page + 1 == len(self.page_starts) and index < len(self.quotes):
+            self.page_starts.append(index)
+        
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = index >= len(self.quotes)
+        return embed
+    
+    def _render_page(self, start):
+        """(embed, index after its last quote) for the page starting at quote start"""
+        embed = discord.Embed(title=self.title, description=self.description, color=0x1E3A8A)
+        used = len(self.title) + len(self.description or "")
+        
+        index = start
+        while index < len(self.quotes) and len(embed.fields) < EMBED_MAX_FIELDS:
+            name, value = self.format_field(self.quotes[index])
+            name = truncate(name, 256)
+            value = truncate(value, 1024)
+            if embed.fields and used + len(name) + len(value) > EMBED_CHAR_BUDGET:
+                break
+            embed.add_field(name=name, value=value, inline=False)
+            used += len(name) + len(value)
+            index += 1
+        
+        # Quotes added while paging can push past the total counted up front
+        embed.set_footer(text=f"Page {self.page + 1} | Quotes {start + 1}-{index} of {max(self.total, index)}")
+        return embed, index
+    
+    async def send(self, interaction):
+        embed = await self.render()
+        if self.next_page.disabled:
+            # Everything fits on one page, no need for buttons
+            await interaction.response.send_message(embed=embed)
+            self.stop()
+            return
+        await interaction.response.send_message(embed=embed, view=self)
+        self.message = await interaction.original_response()
+    
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the person who ran the command can change pages.", ephemeral=True)
+            return False
+        return True
+    
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+    
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+    
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+# -------------------------------
+# Events
+# -------------------------------
+@bot.event
+async def on_ready():
+    print(f"Bot logged in as {bot.user}")
+    print(f"Running shards {sorted(bot.shards)} of {bot.shard_count}")
+    # Discord may have picked the shard count just now (SHARD_COUNT unset)
+    try:
+        await quotes.set_shard_count(bot.shard_count)
+    except Exception as e:
+        print(f"Failed to regroup quotes by shard: {e}")
+    
+    # A fresh gateway session starts without our status
+    try:
+        await show_daily_status()
+    except Exception as e:
+        print(f"Failed to show daily status: {e}")
+
+@bot.listen("on_app_command_completion")
+async def record_command(interaction, command):
+    finish_command(interaction)
+
+@bot.listen("on_message")
+async def buffer_message(message):
+    shard_stats.record(shard_of(message.guild))
+    if not message.author.bot:
+        message_buffer.add(message)
+
+@bot.listen("on_interaction")
+async def count_interaction(interaction):
+    shard_stats.record(shard_of(interaction.guild))
+
+@bot.listen("on_guild_remove")
+async def forget_guild(guild):
+    await quotes.forget(str(guild.id))
+
+@bot.listen("on_message_edit")
+async def buffer_message_edit(before, after):
+    if not after.author.bot:
+        message_buffer.replace(after)
+
+@bot.listen("on_raw_message_delete")
+async def buffer_message_delete(payload):
+    message_buffer.remove(payload.channel_id, payload.message_id)
 
 # -------------------------------
 # Commands
@@ -236,11 +798,17 @@ async def commands_slash(interaction: discord.Interaction):
     embed.add_field(name="/add", value="Add quote(s) from recent messages", inline=False)
     embed.add_field(name="/create", value="Add a new quote manually", inline=False)
     embed.add_field(name="/mine", value="Show all your quotes", inline=False)
+    embed.add_field(name="/search", value="Search quotes by text or author", inline=False)
     embed.add_field(name="/edit", value="Edit one of your quotes", inline=False)
     embed.add_field(name="/delete", value="Delete one of your quotes", inline=False)
     embed.add_field(name="/cycle", value="Cycle to next status quote (owner only)", inline=False)
-    embed.add_field(name="/rave", value="🎉 Toggle RAVE MODE - quotes every 5s! (owner only)", inline=False)
+    embed.add_field(name="/rave", value="🎉 Toggle RAVE MODE in this channel - quotes every 5s! (owner only)", inline=False)
     embed.add_field(name="/all", value="Show all quotes (owner only)", inline=False)
+    embed.add_field(name="/export", value="Download quotes as JSONL or CSV (owner only)", inline=False)
+    embed.add_field(name="/import", value="Add quotes from a JSONL or CSV file (owner only)", inline=False)
+    embed.add_field(name="/shards", value="Show shard latency and load (owner only)", inline=False)
+    embed.add_field(name="/stats", value="Show command latency and bot health (owner only)", inline=False)
+    embed.add_field(name="/profile", value="Sample slow commands with cProfile (owner only)", inline=False)
     embed.add_field(name="/shutdown", value="Shut down the bot (owner only)", inline=False)
     await interaction.response.send_message(embed=embed)
 
@@ -251,13 +819,13 @@ async def add_slash(
     author: str = None,
     skip: int = 0
 ):
-    await interaction.response.defer()
+    await defer(interaction)
     
-    quotes_data = load_quotes()
-    
-    all_messages = [msg async for msg in interaction.channel.history(limit=50)]
-    
-    non_bot_messages = [msg for msg in all_messages if not msg.author.bot]
+    # Serve from the buffer; only hit the history API when it doesn't reach far enough
+    needed = messages + skip
+    non_bot_messages = message_buffer.recent(interaction.channel.id, needed)
+    if len(non_bot_messages) < needed:
+        non_bot_messages = await fetch_recent_messages(interaction.channel, needed)
     
     if not non_bot_messages:
         await interaction.followup.send("No suitable messages found in recent history.")
@@ -327,15 +895,7 @@ async def add_slash(
     
     date_str = datetime.now().strftime("%d/%m/%Y")
     
-    new_quote = {
-        "id": get_next_id(quotes_data),
-        "text": combined_text,
-        "author": author_str,
-        "date": date_str
-    }
-    
-    quotes_data.append(new_quote)
-    save_quotes(quotes_data)
+    new_quote = await quotes.add(namespace_for(interaction), combined_text, author_str, date_str)
     
     preview = combined_text if len(combined_text) <= 100 else combined_text[:97] + "..."
     await interaction.followup.send(f'Quote #{new_quote["id"]} added: "{preview}" - {author_str} ({date_str})')
@@ -350,20 +910,10 @@ async def create_slash(interaction: discord.Interaction, quote: str, author: str
         await interaction.response.send_message("Quote too long (max 500 characters).", ephemeral=True)
         return
     
-    quotes = load_quotes()
-    
     author_name = format_author_name(author) if author else interaction.user.name
     date_str = datetime.now().strftime("%d/%m/%Y")
     
-    new_quote = {
-        "id": get_next_id(quotes),
-        "text": quote.strip(),
-        "author": author_name,
-        "date": date_str
-    }
-    
-    quotes.append(new_quote)
-    save_quotes(quotes)
+    new_quote = await quotes.add(namespace_for(interaction), quote.strip(), author_name, date_str)
     
     await interaction.response.send_message(f'Quote #{new_quote["id"]} added: "{quote}" - {author_name} ({date_str})')
 
@@ -377,20 +927,20 @@ async def edit_slash(interaction: discord.Interaction, quote_id: int, new_text:
         await interaction.response.send_message("New text too long (max 500 characters).", ephemeral=True)
         return
     
-    quotes = load_quotes()
-    quote = find_quote_by_id(quotes, quote_id)
+    namespace = namespace_for(interaction)
+    quote = await quotes.get(namespace, quote_id)
     
     if not quote:
         await interaction.response.send_message(f"Quote #{quote_id} not found.", ephemeral=True)
         return
     
-    if not can_modify_quote(interaction, quote, OWNER_ID):
+    if not await can_modify_quote(interaction, namespace, quote, OWNER_ID):
         await interaction.response.send_message("You can only edit your own quotes.", ephemeral=True)
         return
     
     old_text = quote["text"]
-    quote["text"] = new_text.strip()
-    save_quotes(quotes)
+    await quotes.edit(namespace, quote_id, new_text.strip())
+    render_cache.invalidate(namespace, quote_id)
     
     await interaction.response.send_message(
         f'Quote #{quote_id} updated!\n'
@@ -400,65 +950,65 @@ async def edit_slash(interaction: discord.Interaction, quote_id: int, new_text:
 
 @bot.tree.command(name="delete", description="Delete one of your quotes")
 async def delete_slash(interaction: discord.Interaction, quote_id: int):
-    quotes = load_quotes()
-    quote = find_quote_by_id(quotes, quote_id)
+    namespace = namespace_for(interaction)
+    quote = await quotes.get(namespace, quote_id)
     
     if not quote:
         await interaction.response.send_message(f"Quote #{quote_id} not found.", ephemeral=True)
         return
     
-    if not can_modify_quote(interaction, quote, OWNER_ID):
+    if not await can_modify_quote(interaction, namespace, quote, OWNER_ID):
         await interaction.response.send_message("You can only delete your own quotes.", ephemeral=True)
         return
     
-    quotes.remove(quote)
-    save_quotes(quotes)
+    await quotes.delete(namespace, quote_id)
+    render_cache.invalidate(namespace, quote_id)
     
     await interaction.response.send_message(
         f'Quote #{quote_id} deleted: "{quote["text"]}" - {quote["author"]} ({quote["date"]})'
     )
 
+@edit_slash.autocomplete("quote_id")
+@delete_slash.autocomplete("quote_id")
+async def quote_id_autocomplete(interaction: discord.Interaction, current: str):
+    """Quotes the user may modify, matched by id or by words of the text"""
+    # Same rule as can_modify_quote: the owner may pick any quote
+    author = None if interaction.user.id == OWNER_ID else interaction.user.name
+    matches = await quotes.suggest(namespace_for(interaction), current, author)
+    return [
+        app_commands.Choice(name=truncate(f'#{q["id"]}: ' + " ".join(q["text"].split()), 100), value=q["id"])
+        for q in matches
+    ]
+
+@add_slash.autocomplete("author")
+@create_slash.autocomplete("author")
+async def author_autocomplete(interaction: discord.Interaction, current: str):
+    names = await quotes.suggest_authors(namespace_for(interaction), current)
+    return [app_commands.Choice(name=truncate(name, 100), value=truncate(name, 100)) for name in names]
+
 @bot.tree.command(name="cycle", description="Cycle to next status quote (owner only)")
 async def cycle_slash(interaction: discord.Interaction):
     if interaction.user.id != OWNER_ID:
         await interaction.response.send_message("Owner-only command.", ephemeral=True)
         return
     
-    quotes = load_quotes()
+    counts = await quotes.count(STATUS_NAMESPACE)
     
-    if not quotes:
+    if not counts["quotes"]:
         await interaction.response.send_message("No quotes to cycle through.", ephemeral=True)
         return
     
-    valid_quotes = get_valid_status_quotes(quotes)
-    
-    if not valid_quotes:
+    if not counts["status"]:
         await interaction.response.send_message("No quotes fit in status (max 128 chars).", ephemeral=True)
         return
     
-    # Get current status to find next quote
-    current_activity = bot.activity
-    current_index = 0
-    
-    if current_activity:
-        current_status = current_activity.name
-        # Try to find current quote in valid quotes
-        for i, q in enumerate(valid_quotes):
-            cleaned_text = clean_quote_text(q["text"])
-            status_text = f'"{cleaned_text}" - {q["author"]}'
-            if status_text == current_status:
-                current_index = i
-                break
-    
-    # Get next quote (wrap around)
-    next_index = (current_index + 1) % len(valid_quotes)
-    next_quote = valid_quotes[next_index]
+    # Next quote after the one currently in status (wraps around)
+    pick = await quotes.status_next(STATUS_NAMESPACE, status_quote_id)
     
-    await set_status_to_quote(next_quote)
+    set_status_to_quote(pick)
     
-    cleaned_text = clean_quote_text(next_quote["text"])
     await interaction.response.send_message(
-        f'Status cycled to quote #{next_quote["id"]}:\n"{cleaned_text}" - {next_quote["author"]}'
+        f'Status cycled to quote #{pick["quote"]["id"]}:\n{pick["status_text"]}'
     )
 
 @bot.tree.command(name="rave", description="🎉 Toggle RAVE MODE - quotes cycle every 5 seconds!")
@@ -469,37 +1019,33 @@ async def rave_slash(interaction: discord.Interaction, annoy: str = None):
     Parameters:
     - annoy: Optional - user ID (1234567890) or "everyone" to ping @everyone
     """
-    global rave_mode_active, rave_task, annoy_user_id
-    
     if interaction.user.id != OWNER_ID:
         await interaction.response.send_message("Owner-only command.", ephemeral=True)
         return
     
-    quotes = load_quotes()
-    if not quotes:
+    # Use current channel if in guild, None if in DM (status only)
+    spam_channel = interaction.channel if interaction.guild else None
+    session_key = spam_channel.id if spam_channel else None
+    namespace = namespace_for(interaction) if spam_channel else STATUS_NAMESPACE
+    
+    if session_key not in rave_sessions and not (await quotes.count(namespace))["quotes"]:
         await interaction.response.send_message("No quotes available for rave mode!", ephemeral=True)
         return
     
-    if rave_mode_active:
-        # Stop rave mode
-        rave_mode_active = False
-        annoy_user_id = None
+    if session_key in rave_sessions:
+        # Stop rave mode here
+        session = rave_sessions.pop(session_key)
+        session.stop()
         
-        if rave_task:
-            rave_task.cancel()
-            rave_task = None
-        
-        # Set back to daily quote
-        valid_quotes = get_valid_status_quotes(quotes)
-        if valid_quotes:
-            index = get_daily_quote_index(valid_quotes)
-            await set_status_to_quote(valid_quotes[index])
+        # Set the daily quote back on the shard(s) this rave was cycling, unless another rave still is
+        stopped_shards = None if session.shard_id is None else [session.shard_id]
+        await show_daily_status(shards_without_rave(stopped_shards))
         
         await interaction.response.send_message("🛑 Rave mode DISABLED. Back to chill vibes.")
     
     else:
         # Start rave mode
-        rave_mode_active = True
+        annoy_user_id = None
         
         # Parse annoy parameter
         if annoy:
@@ -511,17 +1057,12 @@ async def rave_slash(interaction: discord.Interaction, annoy: str = None):
                     annoy_user_id = int(annoy.strip())
                 except ValueError:
                     await interaction.response.send_message("Invalid format. Use user ID (1234567890) or 'everyone'", ephemeral=True)
-                    rave_mode_active = False
                     return
-        else:
-            annoy_user_id = None
-        
-        # Determine channel to spam
-        # Use current channel if in guild, None if in DM (status only)
-        spam_channel = interaction.channel if interaction.guild else None
         
         # Start the rave loop
-        rave_task = asyncio.create_task(rave_mode_loop(spam_channel))
+        session = RaveSession(namespace, spam_channel, annoy_user_id)
+        rave_sessions[session_key] = session
+        session.start()
         
         if spam_channel:
             annoy_msg = ""
@@ -540,67 +1081,121 @@ async def all_slash(interaction: discord.Interaction):
         await interaction.response.send_message("Owner-only command.", ephemeral=True)
         return
     
-    quotes = load_quotes()
+    namespace = namespace_for(interaction)
+    total = (await quotes.count(namespace))["quotes"]
     
-    if not quotes:
+    if not total:
         await interaction.response.send_message("No quotes to display.")
         return
     
-    embeds = []
-    current_embed = discord.Embed(title="All Quotes", color=0x1E3A8A)
-    field_count = 0
+    view = QuotePageView(
+        interaction.user.id,
+        lambda after_id, limit: quotes.page(namespace, after_id, limit),
+        total,
+        title="All Quotes",
+        format_field=lambda q: (f"#{q['id']} - {q['author']}", f'"{q["text"]}" ({q["date"]})'),
+        cache_key=("all", namespace)
+    )
+    await view.send(interaction)
+
+@bot.tree.command(name="export", description="Download this server's quotes as a file (owner only)")
+async def export_slash(interaction: discord.Interaction, format: str = "jsonl"):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Owner-only command.", ephemeral=True)
+        return
+    
+    if format not in FORMATS:
+        await interaction.response.send_message(f"Format must be one of: {', '.join(FORMATS)}.", ephemeral=True)
+        return
     
-    for q in quotes:
-        if field_count >= 25:
-            embeds.append(current_embed)
-            current_embed = discord.Embed(title="All Quotes (continued)", color=0x1E3A8A)
-            field_count = 0
+    await defer(interaction, ephemeral=True)
+    namespace = namespace_for(interaction)
+    
+    # Written page by page to a temp file, so the export is never held in memory whole
+    with tempfile.TemporaryDirectory(prefix="qred-export-") as tmp:
+        path = pathlib.Path(tmp) / f"quotes-{namespace}.{format}"
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            count = await export_quotes(quotes, namespace, format, f)
         
-        current_embed.add_field(
-            name=f"#{q['id']} - {q['author']}",
-            value=f'"{q["text"]}" ({q["date"]})',
-            inline=False
-        )
-        field_count += 1
+        limit = interaction.guild.filesize_limit if interaction.guild else EXPORT_FILESIZE_LIMIT
+        if path.stat().st_size > limit:
+            await interaction.followup.send(
+                f"The export of {count} quotes is too large to upload; use `python main.py export {namespace}` instead.",
+                ephemeral=True
+            )
+            return
+        
+        await interaction.followup.send(f"Exported {count} quotes.", file=discord.File(path), ephemeral=True)
+
+@bot.tree.command(name="import", description="Add quotes from a JSONL or CSV file (owner only)")
+async def import_slash(interaction: discord.Interaction, file: discord.Attachment):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Owner-only command.", ephemeral=True)
+        return
     
-    embeds.append(current_embed)
+    file_format = format_for(file.filename)
+    if file_format is None:
+        await interaction.response.send_message("Attach a .jsonl or .csv file.", ephemeral=True)
+        return
+    
+    await defer(interaction, ephemeral=True)
     
-    await interaction.response.send_message(embed=embeds[0])
-    for embed in embeds[1:]:
-        await interaction.followup.send(embed=embed)
+    # The attachment is downloaded in chunks and decoded as it arrives; rows are parsed and stored batch by batch
+    try:
+        async with aiohttp.ClientSession() as session, session.get(file.url) as response:
+            response.raise_for_status()
+            lines = decode_lines(response.content.iter_chunked(IMPORT_CHUNK_SIZE))
+            report = await import_quotes(quotes, namespace_for(interaction), lines, file_format)
+    except (ValueError, aiohttp.ClientError) as e:
+        await interaction.followup.send(f"Import failed: {e}", ephemeral=True)
+        return
+    
+    await interaction.followup.send(truncate(report.summary(), 2000), ephemeral=True)
 
 @bot.tree.command(name="mine", description="Show all your quotes")
 async def mine_slash(interaction: discord.Interaction):
-    quotes = load_quotes()
+    namespace = namespace_for(interaction)
+    user_name = interaction.user.name
+    counts = await quotes.count(namespace, author=user_name)
     
-    if not quotes:
+    if not counts["quotes"]:
         await interaction.response.send_message("No quotes yet.")
         return
     
-    user_name = interaction.user.name
+    total = counts["author"]
     
-    filtered = []
-    for q in quotes:
-        author_names = [a.strip().lower() for a in q["author"].split(",")]
-        if user_name.lower() in author_names:
-            filtered.append(q)
-    
-    if not filtered:
+    if not total:
         await interaction.response.send_message(f"You don't have any quotes yet, {user_name}!")
         return
     
-    category = categorize_author(len(filtered))
+    category = categorize_author(total)
     
-    embed = discord.Embed(
+    view = QuotePageView(
+        interaction.user.id,
+        lambda after_id, limit: quotes.page(namespace, after_id, limit, author=user_name),
+        total,
         title=f"Quotes by {user_name}",
-        description=f"Total: {len(filtered)} quote{'s' if len(filtered) != 1 else ''} - {category}",
-        color=0x1E3A8A
+        description=f"Total: {total} quote{'s' if total != 1 else ''} - {category}",
+        format_field=lambda q: (f"#{q['id']} - {q['date']}", f'"{q["text"]}"'),
+        cache_key=("mine", namespace)
     )
+    await view.send(interaction)
+
+@bot.tree.command(name="search", description="Search quotes by text or author")
+async def search_slash(interaction: discord.Interaction, query: str):
+    results = await quotes.search(namespace_for(interaction), query, limit=10)
+    
+    if not results:
+        await interaction.response.send_message(f"No quotes matching '{query}'.", ephemeral=True)
+        return
     
-    for q in filtered:
+    title = query if len(query) <= 200 else query[:197] + "..."
+    embed = discord.Embed(title=f"Search: {title}", color=0x1E3A8A)
+    
+    for q in results:
         embed.add_field(
-            name=f"#{q['id']} - {q['date']}",
-            value=f'"{q["text"]}"',
+            name=f"#{q['id']} - {q['author']}",
+            value=f'"{q["text"]}" ({q["date"]})',
             inline=False
         )
     
@@ -608,33 +1203,31 @@ async def mine_slash(interaction: discord.Interaction):
 
 @bot.tree.command(name="random", description="Display a random quote")
 async def random_slash(interaction: discord.Interaction):
-    quotes = load_quotes()
+    if RANDOM_BAG_SCOPE == "guild" and interaction.guild:
+        bag_key = ("guild", interaction.guild.id)
+    else:
+        bag_key = ("user", interaction.user.id)
     
-    if not quotes:
+    namespace = namespace_for(interaction)
+    q = await quotes.random(namespace, bag_key)
+    
+    if not q:
         await interaction.response.send_message("No quotes to display")
         return
     
-    seed = f"{datetime.now().timestamp()}{interaction.user.id}"
-    hash_obj = hashlib.md5(seed.encode())
-    hash_int = int(hash_obj.hexdigest(), 16)
-    index = hash_int % len(quotes)
-    
-    q = quotes[index]
-    
-    await interaction.response.send_message(f'#{q["id"]}: "{q["text"]}" - {q["author"]} ({q["date"]})')
+    await interaction.response.send_message(render_quote("random", namespace, q, format_quote_message))
 
 @bot.tree.command(name="daily", description="Show today's quote")
 async def daily_slash(interaction: discord.Interaction):
-    quotes = load_quotes()
+    namespace = namespace_for(interaction)
+    q = await quotes.daily(namespace)
     
-    if not quotes:
+    if not q:
         await interaction.response.send_message("No quotes to display")
         return
     
-    index = get_daily_quote_index(quotes)
-    q = quotes[index]
-    
-    await interaction.response.send_message(f'Daily Quote\n#{q["id"]}: "{q["text"]}" - {q["author"]} ({q["date"]})')
+    message = render_quote("daily", namespace, q, format_quote_message)
+    await interaction.response.send_message(f"Daily Quote\n{message}")
 
 @bot.tree.command(name="shutdown", description="Shutdown the bot (owner only)")
 async def shutdown_slash(interaction: discord.Interaction):
@@ -645,17 +1238,129 @@ async def shutdown_slash(interaction: discord.Interaction):
     await interaction.response.send_message("Shutting down...")
     await bot.close()
 
+@bot.tree.command(name="shards", description="Show shard latency and load (owner only)")
+async def shards_slash(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Owner-only command.", ephemeral=True)
+        return
+    
+    guild_counts = Counter(guild.shard_id for guild in bot.guilds)
+    loaded = {shard_id: len(await quotes.loaded(shard_id)) for shard_id in bot.shards}
+    embed = discord.Embed(title=f"Shards ({len(bot.shards)} of {bot.shard_count})", color=0x1E3A8A)
+    
+    for shard_id, latency in sorted(bot.latencies)[:EMBED_MAX_FIELDS]:
+        embed.add_field(
+            name=f"Shard {shard_id}",
+            value=(
+                f"Latency: {latency * 1000:.0f} ms\n"
+                f"Guilds: {guild_counts[shard_id]} ({loaded.get(shard_id, 0)} loaded)\n"
+                f"Events: {shard_stats.per_minute(shard_id):.0f}/min, {shard_stats.totals[shard_id]} total"
+            ),
+            inline=True
+        )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="stats", description="Show command latency and bot health (owner only)")
+async def stats_slash(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Owner-only command.", ephemeral=True)
+        return
+    
+    uptime = int(time.time() - METRICS.started)
+    lag = METRICS.histogram("event_loop_lag_seconds")
+    description = f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m"
+    if lag:
+        description += f"\nLoop lag: p50 {format_ms(lag.quantile(0.5))}, p99 {format_ms(lag.quantile(0.99))}, max {format_ms(lag.max)}"
+    embed = discord.Embed(title="Stats", description=description, color=0x1E3A8A)
+    
+    def latency_lines(name, label):
+        series = sorted(METRICS.series(name), key=lambda s: -s[1].count)
+        errors = {labels.get("command"): n for labels, n in METRICS.counter_values("command_errors_total")}
+        lines = []
+        for labels, h in series:
+            line = f"{label(labels)}: {h.count}× p50 {format_ms(h.quantile(0.5))}, p99 {format_ms(h.quantile(0.99))}"
+            if errors.get(labels.get("command")) and name == "command_duration_seconds":
+                line += f" ({errors[labels['command']]} failed)"
+            lines.append(line)
+        return truncate("\n".join(lines), 1024) if lines else "Nothing yet"
+    
+    embed.add_field(name="Commands", value=latency_lines("command_duration_seconds", lambda labels: f"/{labels['command']}"), inline=False)
+    embed.add_field(name="Defer → followup", value=latency_lines("defer_to_followup_seconds", lambda labels: f"/{labels['command']}"), inline=False)
+    embed.add_field(name="Storage", value=latency_lines("storage_seconds", lambda labels: labels["op"]), inline=False)
+    
+    discord_hits = sum(n for _, n in METRICS.counter_values("rate_limit_hits_total"))
+    metrics = scheduler.metrics()
+    embed.add_field(
+        name="Rate limits",
+        value=(
+            f"Discord 429s: {discord_hits}\n"
+            f"Paced by scheduler: {sum(metrics['deferred'].values())}, dropped: {sum(metrics['dropped'].values())}\n"
+            f"Presence updates: {metrics['presence_sent']} sent, {metrics['presence_coalesced']} coalesced"
+        ),
+        inline=False
+    )
+    
+    lookups = render_cache.hits + render_cache.misses
+    embed.add_field(
+        name="Render cache",
+        value=(
+            f"{render_cache.hits} hits, {render_cache.misses} misses"
+            f"{f' ({render_cache.hits / lookups:.0%} hit rate)' if lookups else ''}, "
+            f"{len(render_cache)}/{render_cache.max_entries} entries"
+        ),
+        inline=False
+    )
+    
+    if profiler.enabled or profiler.captures:
+        captures = "\n".join(f"/{name} {format_ms(duration)}: {path.name}" for name, duration, path in list(profiler.captures)[-5:])
+        embed.add_field(
+            name="Profiler",
+            value=truncate(
+                f"Sampling {profiler.sample_rate:.0%} of commands, keeping those over {format_ms(profiler.slow_seconds)}\n{captures}",
+                1024
+            ),
+            inline=False
+        )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="profile", description="Sample slow commands with cProfile (owner only)")
+async def profile_slash(interaction: discord.Interaction, sample_rate: float, slow_ms: int = None):
+    """
+    Parameters:
+    - sample_rate: Share of commands to profile (0-1, 0 turns profiling off)
+    - slow_ms: Keep captures of commands slower than this
+    """
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("Owner-only command.", ephemeral=True)
+        return
+    
+    profiler.sample_rate = min(max(sample_rate, 0.0), 1.0)
+    if slow_ms is not None:
+        profiler.slow_seconds = slow_ms / 1000
+    
+    if not profiler.enabled:
+        await interaction.response.send_message("Profiling disabled.", ephemeral=True)
+        return
+    await interaction.response.send_message(
+        f"Profiling {profiler.sample_rate:.0%} of commands; captures over {format_ms(profiler.slow_seconds)} "
+        f"are saved to {PROFILE_DIR.name}/",
+        ephemeral=True
+    )
+
 @bot.tree.command(name="sync", description="Force sync slash commands (owner only)")
 async def sync_slash(interaction: discord.Interaction):
     if interaction.user.id != OWNER_ID:
         await interaction.response.send_message("You don't have permission.", ephemeral=True)
         return
     
-    await interaction.response.defer(ephemeral=True)
+    await defer(interaction, ephemeral=True)
     
     try:
         # Sync globally
         synced = await bot.tree.sync()
+        remember_command_sync(command_fingerprint())
         
         # Also sync to current guild for immediate effect
         if interaction.guild:
@@ -674,8 +1379,60 @@ async def sync_slash(interaction: discord.Interaction):
     except Exception as e:
         await interaction.followup.send(f"❌ Sync failed: {e}", ephemeral=True)
 
+# -------------------------------
+# Command line import/export
+# -------------------------------
+async def transfer_cli(argv):
+    """`python main.py export|import`: bulk copies without going through Discord
+
+    Goes through the quote server when QUOTE_SOCKET is set; otherwise it
+    opens the quote files directly, so stop the bot first.
+    """
+    parser = argparse.ArgumentParser(prog="main.py")
+    actions = parser.add_subparsers(dest="action", required=True)
+    export_parser = actions.add_parser("export", help="write a server's quotes as JSONL or CSV")
+    export_parser.add_argument("namespace", help="server id, or dm-<user id>")
+    export_parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export_parser.add_argument("--format", choices=FORMATS, help="default: from the file name, else jsonl")
+    import_parser = actions.add_parser("import", help="add quotes to a server from JSONL or CSV")
+    import_parser.add_argument("namespace", help="server id, or dm-<user id>")
+    import_parser.add_argument("file", help="file to read, - for stdin")
+    import_parser.add_argument("--format", choices=FORMATS, help="default: from the file name")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.action == "export":
+            file_format = args.format or (args.output and format_for(args.output)) or "jsonl"
+            if args.output:
+                with open(args.output, "w", encoding="utf-8", newline="") as f:
+                    count = await export_quotes(quotes, args.namespace, file_format, f)
+            else:
+                count = await export_quotes(quotes, args.namespace, file_format, sys.stdout)
+            print(f"Exported {count} quotes", file=sys.stderr)
+        else:
+            file_format = args.format or format_for(args.file)
+            if file_format is None:
+                parser.error("can't tell the format from the file name, pass --format")
+            f = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8-sig", newline="")
+            with f:
+                report = await import_quotes(quotes, args.namespace, file_lines(f), file_format, batch_size=args.batch_size)
+            print(report.summary())
+    finally:
+        await quotes.close()
+
 # -------------------------------
 # Run the bot
 # -------------------------------
 if __name__ == "__main__":
-    bot.run(TOKEN)
\ No newline at end of file
+    if sys.argv[1:2] == ["quote-server"]:
+        if not QUOTE_SOCKET:
+            sys.exit("Set QUOTE_SOCKET to the socket path the quote server should listen on")
+        asyncio.run(serve(open_registry(), QUOTE_SOCKET))
+    elif sys.argv[1:2] in (["export"], ["import"]):
+        try:
+            asyncio.run(transfer_cli(sys.argv[1:]))
+        except (OSError, ValueError) as e:
+            sys.exit(f"Error: {e}")
+    else:
+        bot.run(TOKEN)
\ No newline at end of file
@@ -0,0 +1,256 @@
+import asyncio
+import bisect
+import cProfile
+import logging
+import pathlib
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram, the same shape Prometheus scrapes"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimated quantile: upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """Labelled histograms and counters; safe to update from the writer threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self._help = {}
+        self._collectors = []
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collect):
+        """collect() -> [(name, labels, value)] counters read at export time (e.g. scheduler totals)"""
+        self._collectors.append(collect)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(self._key(name, labels))
+
+    def series(self, name):
+        """(labels dict, histogram) for every label set of a histogram"""
+        with self._lock:
+            return [(dict(labels), h) for (n, labels), h in self.histograms.items() if n == name]
+
+    def counter_values(self, name):
+        with self._lock:
+            values = [(dict(labels), value) for (n, labels), value in self.counters.items() if n == name]
+        for collect in self._collectors:
+            values.extend((labels, value) for n, labels, value in collect() if n == name)
+        return values
+
+    def render_prometheus(self, prefix="qred_"):
+        """All metrics in the Prometheus text exposition format"""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        collected = [(name, tuple(sorted(labels.items())), value) for collect in self._collectors for name, labels, value in collect()]
+
+        typed = set()
+        for (name, labels), h in histograms:
+            full = prefix + name
+            if full not in typed:
+                typed.add(full)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f"{full}_bucket{label_text(labels, [('le', repr(bound))])} {cumulative}")
+            lines.append(f"{full}_bucket{label_text(labels, [('le', '+Inf')])} {h.count}")
+            lines.append(f"{full}_sum{label_text(labels)} {h.sum}")
+            lines.append(f"{full}_count{label_text(labels)} {h.count}")
+
+        for (name, labels), value in counters + [((n, l), v) for n, l, v in collected]:
+            full = prefix + name
+            if full not in typed:
+                typed.add(full)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} counter")
+            lines.append(f"{full}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the bot and the quote store
+METRICS = Metrics()
+METRICS.describe("command_duration_seconds", "Time from receiving an interaction until its command returned")
+METRICS.describe("command_errors_total", "Commands that raised")
+METRICS.describe("defer_to_followup_seconds", "Time between deferring an interaction and its last followup")
+METRICS.describe("storage_seconds", "Time spent loading, indexing, encoding and saving quotes")
+METRICS.describe("event_loop_lag_seconds", "How late the event loop woke up a sleeping task")
+METRICS.describe("rate_limit_hits_total", "Requests Discord rate limited")
+
+
+async def monitor_loop_lag(metrics=METRICS, interval=0.5):
+    """Record how late the loop wakes a sleeper: time it spent blocked elsewhere"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag_seconds", max(0.0, loop.time() - start - interval))
+
+
+class RateLimitLogCounter(logging.Handler):
+    """Counts discord.py's "being rate limited" warnings, which it retries internally"""
+
+    def __init__(self, metrics=METRICS):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        message = record.getMessage()
+        if "rate limit" in message.lower():
+            scope = "global" if "global" in message.lower() else "route"
+            self.metrics.inc("rate_limit_hits_total", source="discord", scope=scope)
+
+
+async def serve_prometheus(port, metrics=METRICS, host="127.0.0.1"):
+    """Serve the metrics as Prometheus text on http://host:port/metrics"""
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            # Skip the headers
+            while (await reader.readline()).strip():
+                pass
+            if request.split(b" ")[1:2] == [b"/metrics"]:
+                body = metrics.render_prometheus().encode()
+                status = b"200 OK"
+            else:
+                body = b"Not found\n"
+                status = b"404 Not Found"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class SlowCallProfiler:
+    """Profiles a sample of interactions and keeps the slow ones as .prof files
+
+    cProfile sees the whole thread, so a capture also contains whatever else
+    the event loop ran meanwhile; only one capture runs at a time.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, slow_seconds=0.5, keep=20):
+        self.directory = pathlib.Path(directory)
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.captures = deque(maxlen=keep)
+        self._active = None
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start(self):
+        """A running profile for this call, or None if it wasn't sampled"""
+        if self._active is not None or not self.enabled or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already attached to this thread
+            return None
+        self._active = profile
+        return profile
+
+    def finish(self, profile, name, duration):
+        if profile is None or profile is not self._active:
+            return None
+        profile.disable()
+        self._active = None
+        if duration < self.slow_seconds:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            print(f"Error saving profile: {e}")
+            return None
+        self.captures.append((name, duration, path))
+        return path
@@ -0,0 +1,231 @@
+import asyncio
+import codecs
+import csv
+import json
+import pathlib
+from datetime import datetime
+
+from quote_store import QUOTE_MAX_LEN, encode_quote
+
+FORMATS = ("jsonl", "csv")
+CSV_FIELDS = ("id", "text", "author", "date")
+# Quotes fetched per page when exporting, and added per commit when importing
+EXPORT_PAGE_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+# Rejected lines listed in an import report; the rest are only counted
+MAX_REPORTED_ERRORS = 10
+# Longest line (or CSV row) an import buffers; a quote is at most QUOTE_MAX_LEN characters
+MAX_LINE_CHARS = 64 * 1024
+
+
+def format_for(filename):
+    """Format implied by a file name, or None"""
+    suffix = pathlib.Path(filename).suffix.lower().lstrip(".")
+    if suffix == "ndjson":
+        return "jsonl"
+    return suffix if suffix in FORMATS else None
+
+
+# -------------------------------
+# Export
+# -------------------------------
+def write_page(f, page, fmt):
+    if fmt == "csv":
+        csv.writer(f).writerows([q["id"], q["text"], q["author"], q["date"]] for q in page)
+    else:
+        f.write("".join(json.dumps(q, ensure_ascii=False, default=encode_quote) + "\n" for q in page))
+
+
+async def export_quotes(quotes, namespace, fmt, f, page_size=EXPORT_PAGE_SIZE):
+    """Write a namespace's quotes to text file f one page at a time; returns how many
+
+    JSONL lines are the quotes.json records, extra keys included. CSV has
+    the id, text, author and date columns.
+    """
+    if fmt == "csv":
+        csv.writer(f).writerow(CSV_FIELDS)
+    count = 0
+    after_id = 0
+    while True:
+        page = await quotes.page(namespace, after_id, page_size)
+        if not page:
+            return count
+        write_page(f, page, fmt)
+        count += len(page)
+        after_id = page[-1]["id"]
+        # In-process pages come back without suspending; give other commands a turn
+        await asyncio.sleep(0)
+
+
+# -------------------------------
+# Import
+# -------------------------------
+class ImportReport:
+    """What an import added and which lines it rejected"""
+
+    def __init__(self):
+        self.imported = 0
+        self.first_id = None
+        self.last_id = None
+        self.rejected = 0
+        self.errors = []
+
+    def added(self, ids):
+        if ids:
+            self.imported += len(ids)
+            self.first_id = ids[0] if self.first_id is None else self.first_id
+            self.last_id = ids[-1]
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {reason}")
+
+    def summary(self):
+        lines = [f"Imported {self.imported} quotes"]
+        if self.imported:
+            lines[0] += f" (#{self.first_id}-#{self.last_id})"
+        if self.rejected:
+            lines.append(f"Skipped {self.rejected} invalid lines:")
+            lines.extend(self.errors)
+            if self.rejected > len(self.errors):
+                lines.append(f"... and {self.rejected - len(self.errors)} more")
+        return "\n".join(lines)
+
+
+async def file_lines(f):
+    """Lines of text file f, as the async iterable import_quotes() reads"""
+    for line in f:
+        yield line
+
+
+async def decode_lines(chunks, encoding="utf-8-sig"):
+    """Lines of an async stream of byte chunks (e.g. a download), decoded as they arrive"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    async for chunk in chunks:
+        # Only \n ends a line; str.splitlines() would also split on characters JSON strings may contain
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+        if len(pending) > MAX_LINE_CHARS:
+            raise ValueError(f"a line is longer than {MAX_LINE_CHARS} characters")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _csv_rows(lines):
+    """(first line number, text) of each CSV row; quoted fields may span lines"""
+    row = ""
+    first = 0
+    async for line_number, line in _numbered(lines):
+        if not row:
+            first = line_number
+        row += line
+        # Quotes inside fields are doubled, so an odd count means a quoted field goes on
+        if row.count('"') % 2 == 0:
+            yield first, row
+            row = ""
+        elif len(row) > MAX_LINE_CHARS:
+            raise ValueError(f"the row starting on line {first} is longer than {MAX_LINE_CHARS} characters")
+    if row:
+        yield first, row
+
+
+async def _numbered(lines):
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        yield line_number, line
+
+
+async def read_records(lines, fmt):
+    """(line number, record dict or why the line is unreadable) for each row of an async stream of text lines"""
+    if fmt == "csv":
+        fieldnames = None
+        async for line_number, text in _csv_rows(lines):
+            try:
+                row = next(csv.reader([text]), None)
+            except csv.Error as e:
+                yield line_number, f"invalid CSV ({e})"
+                continue
+            if not row:
+                continue
+            if fieldnames is None:
+                fieldnames = row
+                missing = [field for field in ("text", "author") if field not in fieldnames]
+                if missing:
+                    raise ValueError(f"CSV header is missing the {', '.join(missing)} column")
+                continue
+            # Other columns are ignored
+            values = dict(zip(fieldnames, row))
+            yield line_number, {field: values.get(field) for field in ("text", "author", "date")}
+        if fieldnames is None:
+            raise ValueError("CSV header is missing the text, author column")
+        return
+
+    async for line_number, line in _numbered(lines):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"invalid JSON ({e.msg})"
+            continue
+        yield line_number, record if isinstance(record, dict) else "not a JSON object"
+
+
+def validate_record(record, default_date):
+    """(quote dict for import_batch, None) or (None, why it's rejected)
+
+    Applies the same rules as /create; a missing date becomes default_date
+    and the record's own id is dropped, new ids are allocated on import.
+    """
+    if isinstance(record, str):
+        return None, record
+    text = record.get("text")
+    author = record.get("author")
+    date = record.get("date") or default_date
+    if not isinstance(text, str) or not text.strip():
+        return None, "empty quote"
+    if len(text) > QUOTE_MAX_LEN:
+        return None, f"quote too long (max {QUOTE_MAX_LEN} characters)"
+    if not isinstance(author, str) or not author.strip():
+        return None, "missing author"
+    if not isinstance(date, str):
+        return None, "date is not a string"
+    quote = {key: value for key, value in record.items() if key != "id"}
+    quote.update(text=text.strip(), author=author.strip(), date=date.strip())
+    return quote, None
+
+
+async def import_quotes(quotes, namespace, lines, fmt, batch_size=IMPORT_BATCH_SIZE, default_date=None):
+    """Validate and add the quotes in an async stream of text lines, batch_size at a time
+
+    Lines come from file_lines() or decode_lines(), so only one batch is
+    held at a time. Each batch gets its ids in one go and is committed as a
+    unit; the namespace's indexes are updated once at the end (even if
+    reading fails halfway, so the quotes added so far are fully usable).
+    """
+    report = ImportReport()
+    default_date = default_date or datetime.now().strftime("%d/%m/%Y")
+    batch = []
+    try:
+        async for line, record in read_records(lines, fmt):
+            quote, reason = validate_record(record, default_date)
+            if reason:
+                report.reject(line, reason)
+                continue
+            batch.append(quote)
+            if len(batch) >= batch_size:
+                report.added(await quotes.import_batch(namespace, batch))
+                batch = []
+                # Give other commands a turn between batches
+                await asyncio.sleep(0)
+        if batch:
+            report.added(await quotes.import_batch(namespace, batch))
+    finally:
+        if report.imported:
+            await quotes.finish_import(namespace)
+    return report
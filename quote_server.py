@@ -0,0 +1,486 @@
+import asyncio
+import itertools
+import json
+import os
+import signal
+import socket
+
+from quote_store import encode_quote
+
+# Longest request or reply line; a bigger one fails just its own request
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# Imported quotes indexed between yields to the event loop
+INDEX_CHUNK_SIZE = 500
+
+
+# -------------------------------
+# Operations
+# -------------------------------
+def _status_pick(store, quote):
+    if quote is None:
+        return None
+    return {"quote": quote, "status_text": store.status_text(quote)}
+
+
+def _op_count(registry, namespace, author=None):
+    store = registry.store(namespace)
+    counts = {"quotes": len(store), "status": store.status_count()}
+    if author is not None:
+        counts["author"] = store.count_by_author(author)
+    return counts
+
+
+def _op_get(registry, namespace, quote_id):
+    return registry.store(namespace).get(quote_id)
+
+
+def _op_add(registry, namespace, text, author, date):
+    return registry.store(namespace).add(text, author, date)
+
+
+def _op_edit(registry, namespace, quote_id, text):
+    return registry.store(namespace).edit(quote_id, text)
+
+
+def _op_delete(registry, namespace, quote_id):
+    return registry.store(namespace).delete(quote_id)
+
+
+def _op_is_author(registry, namespace, quote_id, name):
+    return registry.store(namespace).is_author(quote_id, name)
+
+
+def _op_between(registry, namespace, start, end):
+    return registry.store(namespace).between(start, end)
+
+
+def _op_page(registry, namespace, after_id=0, limit=1000, author=None):
+    return registry.store(namespace).page(after_id, limit, author)
+
+
+def _op_import_batch(registry, namespace, quotes):
+    return registry.store(namespace).import_batch(quotes)
+
+
+async def _op_finish_import(registry, namespace):
+    store = registry.store(namespace)
+    count = store.finish_import(INDEX_CHUNK_SIZE)
+    while store.unindexed():
+        # Indexing a big import in one go would stall every other request for seconds
+        await asyncio.sleep(0)
+        count += store.finish_import(INDEX_CHUNK_SIZE)
+    return count
+
+
+def _op_suggest(registry, namespace, typed, author=None, limit=25):
+    return registry.store(namespace).suggest(typed, author, limit)
+
+
+def _op_suggest_authors(registry, namespace, typed, limit=25):
+    return registry.store(namespace).suggest_authors(typed, limit)
+
+
+def _op_search(registry, namespace, query, limit=10):
+    return registry.store(namespace).search(query, limit)
+
+
+def _op_random(registry, namespace, key):
+    # JSON turns tuple keys into lists
+    return registry.shuffler(namespace).draw(tuple(key))
+
+
+def _op_daily(registry, namespace):
+    return registry.daily(namespace).quote()
+
+
+def _op_daily_status(registry, namespace):
+    return _status_pick(registry.store(namespace), registry.daily(namespace).status_quote())
+
+
+def _op_status_pick(registry, namespace, position):
+    """Status-pool quote at position, falling back to all quotes if none fit"""
+    store = registry.store(namespace)
+    quote = store.status_quote_at(position)
+    if quote is None:
+        quote = store.quote_at(position)
+    return _status_pick(store, quote)
+
+
+def _op_status_next(registry, namespace, after_id=None):
+    """Status-pool quote following after_id (wrapping around)"""
+    store = registry.store(namespace)
+    position = store.status_position(after_id) if after_id is not None else None
+    return _status_pick(store, store.status_quote_at((position or 0) + 1))
+
+
+def _op_loaded(registry, namespace=None, shard_id=None):
+    return registry.loaded(shard_id)
+
+
+def _op_set_shard_count(registry, namespace=None, shard_count=1):
+    registry.set_shard_count(shard_count)
+
+
+async def _op_forget(registry, namespace):
+    store = registry.pop(namespace)
+    if store:
+        await asyncio.to_thread(store.close)
+    return store is not None
+
+
+async def _op_evict(registry, namespace=None, max_idle=1800, keep=()):
+    stores = registry.pop_idle(max_idle, keep=set(keep))
+    for store in stores:
+        await asyncio.to_thread(store.close)
+    return len(stores)
+
+
+OPS = {
+    "count": _op_count,
+    "get": _op_get,
+    "add": _op_add,
+    "edit": _op_edit,
+    "delete": _op_delete,
+    "is_author": _op_is_author,
+    "between": _op_between,
+    "page": _op_page,
+    "import_batch": _op_import_batch,
+    "finish_import": _op_finish_import,
+    "search": _op_search,
+    "suggest": _op_suggest,
+    "suggest_authors": _op_suggest_authors,
+    "random": _op_random,
+    "daily": _op_daily,
+    "daily_status": _op_daily_status,
+    "status_pick": _op_status_pick,
+    "status_next": _op_status_next,
+    "loaded": _op_loaded,
+    "set_shard_count": _op_set_shard_count,
+    "forget": _op_forget,
+    "evict": _op_evict,
+}
+
+
+# Operations that don't need their namespace loaded
+UNLOADED_OPS = {"loaded", "set_shard_count", "forget", "evict"}
+
+
+async def _load(registry, namespace):
+    entry = await asyncio.to_thread(registry.prepare, namespace)
+    if entry is not None:
+        registry.attach(namespace, entry)
+
+
+async def ensure_loaded(registry, namespace):
+    """Open or reload a namespace on a worker thread, so a big one doesn't stall the event loop
+
+    Requests for a namespace that is being loaded wait for that one load.
+    """
+    loading = registry.loading.get(namespace)
+    if loading is None:
+        if not registry.stale(namespace):
+            return
+        loading = registry.loading[namespace] = asyncio.ensure_future(_load(registry, namespace))
+        loading.add_done_callback(lambda _: registry.loading.pop(namespace, None))
+    await asyncio.shield(loading)
+
+
+async def dispatch(registry, op, namespace=None, args=None):
+    """Run one operation against the registry; ops that close stores are awaited"""
+    handler = OPS.get(op)
+    if handler is None:
+        raise ValueError(f"Unknown operation: {op}")
+    if namespace is not None and op not in UNLOADED_OPS:
+        await ensure_loaded(registry, namespace)
+    result = handler(registry, namespace, **(args or {}))
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+
+class QuoteServerError(Exception):
+    """An operation failed on the quote server"""
+
+
+# -------------------------------
+# Service interface
+# -------------------------------
+class QuoteService:
+    """Quote operations by namespace, awaited by the command handlers
+
+    LocalQuotes runs them on an in-process registry; QuoteClient sends them to
+    a QuoteServer so several bot processes share one consistent store.
+    """
+
+    async def request(self, op, namespace=None, **args):
+        raise NotImplementedError
+
+    async def count(self, namespace, author=None):
+        """{"quotes": n, "status": n} for a namespace, plus "author": n if author is given"""
+        return await self.request("count", namespace, author=author)
+
+    async def get(self, namespace, quote_id):
+        return await self.request("get", namespace, quote_id=quote_id)
+
+    async def add(self, namespace, text, author, date):
+        return await self.request("add", namespace, text=text, author=author, date=date)
+
+    async def edit(self, namespace, quote_id, text):
+        return await self.request("edit", namespace, quote_id=quote_id, text=text)
+
+    async def delete(self, namespace, quote_id):
+        return await self.request("delete", namespace, quote_id=quote_id)
+
+    async def is_author(self, namespace, quote_id, name):
+        return await self.request("is_author", namespace, quote_id=quote_id, name=name)
+
+    async def between(self, namespace, start, end):
+        """Quotes dated start to end inclusive (DD/MM/YYYY)"""
+        return await self.request("between", namespace, start=start, end=end)
+
+    async def page(self, namespace, after_id=0, limit=1000, author=None):
+        """Up to limit quotes with ids above after_id, in id order; only author's if given"""
+        return await self.request("page", namespace, after_id=after_id, limit=limit, author=author)
+
+    async def import_batch(self, namespace, quotes):
+        """Add validated quote dicts under new ids; returns the ids"""
+        return await self.request("import_batch", namespace, quotes=quotes)
+
+    async def finish_import(self, namespace):
+        """Index the quotes imported so far"""
+        return await self.request("finish_import", namespace)
+
+    async def search(self, namespace, query, limit=10):
+        return await self.request("search", namespace, query=query, limit=limit)
+
+    async def suggest(self, namespace, typed, author=None, limit=25):
+        """Quotes matching a partly typed id or text (only author's, if given)"""
+        return await self.request("suggest", namespace, typed=typed, author=author, limit=limit)
+
+    async def suggest_authors(self, namespace, typed, limit=25):
+        return await self.request("suggest_authors", namespace, typed=typed, limit=limit)
+
+    async def random(self, namespace, key):
+        return await self.request("random", namespace, key=list(key))
+
+    async def daily(self, namespace):
+        return await self.request("daily", namespace)
+
+    async def daily_status(self, namespace):
+        """Today's status quote as {"quote", "status_text"}, or None"""
+        return await self.request("daily_status", namespace)
+
+    async def status_pick(self, namespace, position):
+        return await self.request("status_pick", namespace, position=position)
+
+    async def status_next(self, namespace, after_id=None):
+        return await self.request("status_next", namespace, after_id=after_id)
+
+    async def loaded(self, shard_id=None):
+        """Loaded namespaces, optionally only those of one gateway shard"""
+        return await self.request("loaded", shard_id=shard_id)
+
+    async def set_shard_count(self, shard_count):
+        """Regroup loaded namespaces by gateway shard once the shard count is known"""
+        return await self.request("set_shard_count", shard_count=shard_count)
+
+    async def forget(self, namespace):
+        return await self.request("forget", namespace)
+
+    async def evict(self, max_idle, keep=()):
+        return await self.request("evict", max_idle=max_idle, keep=list(keep))
+
+    async def close(self):
+        pass
+
+
+class LocalQuotes(QuoteService):
+    """Runs quote operations on a registry owned by this process"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    async def request(self, op, namespace=None, **args):
+        return await dispatch(self.registry, op, namespace, args)
+
+    async def close(self):
+        # Make sure queued quote changes hit the disk before going down
+        await asyncio.to_thread(self.registry.close)
+
+
+class QuoteClient(QuoteService):
+    """Sends quote operations to a QuoteServer over its Unix socket
+
+    Requests are pipelined on one connection: each carries an id and callers
+    wait only for their own reply. A dropped connection fails the requests in
+    flight and is reopened on the next request.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_BYTES)
+                self._read_task = asyncio.create_task(self._read_replies(self._reader))
+
+    async def _read_replies(self, reader):
+        error = ConnectionError("Quote server closed the connection")
+        try:
+            while line := await reader.readline():
+                reply = json.loads(line)
+                future = self._pending.pop(reply["id"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in reply:
+                    future.set_exception(QuoteServerError(reply["error"]))
+                else:
+                    future.set_result(reply.get("result"))
+        except Exception as e:
+            error = ConnectionError(f"Quote server connection lost: {e}")
+        finally:
+            self._drop_connection(error)
+
+    def _drop_connection(self, error):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def request(self, op, namespace=None, **args):
+        if self._writer is None:
+            await self._connect()
+        request_id = next(self._ids)
+        message = json.dumps({"id": request_id, "op": op, "ns": namespace, "args": args}, ensure_ascii=False).encode()
+        if len(message) >= MAX_MESSAGE_BYTES:
+            # The server would drop the connection, failing every request on it
+            raise QuoteServerError(f"{op} request too large ({len(message)} bytes)")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(message + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._drop_connection(ConnectionError("Quote client closed"))
+
+
+# -------------------------------
+# Server
+# -------------------------------
+class QuoteServer:
+    """Owns a QuoteRegistry and serves it to QuoteClients on a Unix socket
+
+    Each request runs as its own task and is answered as soon as it's done,
+    so one waiting on a namespace load doesn't hold up the rest of its
+    connection; QuoteClient matches replies to requests by id. Operations run
+    on the server's event loop, so every client sees the same store.
+    """
+
+    def __init__(self, registry, path):
+        self.registry = registry
+        self.path = str(path)
+        self._server = None
+        self._connections = set()
+
+    def _clear_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            # Left behind by a server that didn't shut down cleanly
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(f"A quote server is already listening on {self.path}")
+        finally:
+            probe.close()
+
+    async def start(self):
+        self._clear_stale_socket()
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=MAX_MESSAGE_BYTES)
+        os.chmod(self.path, 0o600)
+        print(f"Quote server listening on {self.path}")
+
+    async def _answer(self, line, writer, write_lock):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            result = await dispatch(self.registry, request.get("op"), request.get("ns"), request.get("args"))
+            reply = {"id": request_id, "result": result}
+        except Exception as e:
+            reply = {"id": request_id, "error": str(e)}
+        data = json.dumps(reply, ensure_ascii=False, default=encode_quote).encode()
+        if len(data) >= MAX_MESSAGE_BYTES:
+            # The client couldn't read it and would drop the connection, failing every request on it
+            data = json.dumps({"id": request_id, "error": f"Reply too large ({len(data)} bytes)"}).encode()
+        async with write_lock:
+            if writer.is_closing():
+                return
+            writer.write(data + b"\n")
+            # Let pipelined replies pile up in the buffer before waiting on the socket
+            if writer.transport.get_write_buffer_size() > 64 * 1024:
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    # _handle reports the disconnect when its read fails
+                    pass
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._answer(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending, return_exceptions=True)
+            async with write_lock:
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            print(f"Quote client disconnected: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Clients see EOF; their handlers finish the requests in hand and return
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        await asyncio.to_thread(self.registry.close)
+
+
+async def serve(registry, path):
+    """Run a quote server until SIGINT/SIGTERM"""
+    server = QuoteServer(registry, path)
+    await server.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
@@ -0,0 +1,2045 @@
+import bisect
+import functools
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import pathlib
+import random
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from metrics import METRICS
+
+STATUS_MAX_LEN = 128
+# Longest quote /create accepts
+QUOTE_MAX_LEN = 500
+
+
+def clean_quote_text(text):
+    """Remove Discord mentions and clean text for status"""
+    # Remove user mentions <@123456789> or <@!123456789>
+    text = re.sub(r'<@!?\d+>', '', text)
+    # Remove role mentions <@&123456789>
+    text = re.sub(r'<@&\d+>', '', text)
+    # Remove channel mentions <#123456789>
+    text = re.sub(r'<#\d+>', '', text)
+    # Clean up extra spaces
+    text = ' '.join(text.split())
+    return text.strip()
+
+
+def format_status_text(quote):
+    return f'"{clean_quote_text(quote["text"])}" - {quote["author"]}'
+
+
+def fits_status(quote):
+    return len(format_status_text(quote)) <= STATUS_MAX_LEN
+
+
+# -------------------------------
+# Quote records
+# -------------------------------
+DATE_FORMAT = "%d/%m/%Y"
+
+
+def encode_date(text):
+    """Day ordinal for a DD/MM/YYYY string; anything that wouldn't round-trip is kept as is"""
+    if not isinstance(text, str):
+        return text
+    try:
+        ordinal = datetime.strptime(text, DATE_FORMAT).toordinal()
+    except ValueError:
+        # e.g. free text
+        return text
+    if datetime.fromordinal(ordinal).strftime(DATE_FORMAT) != text:
+        # e.g. "1/2/2023": keep the exact string
+        return text
+    return ordinal
+
+
+@functools.lru_cache(maxsize=4096)
+def _date_text(ordinal):
+    return datetime.fromordinal(ordinal).strftime(DATE_FORMAT)
+
+
+def decode_date(day):
+    if type(day) is int:
+        return _date_text(day)
+    return day
+
+
+class InternTable:
+    """One shared object per distinct author string and date among a set of quotes
+
+    Each store (or loaded file) has its own, so nothing outlives the quotes
+    using it. Quotes hold the objects themselves: the table only avoids
+    duplicates and is never needed to read a quote back.
+    """
+
+    def __init__(self):
+        self._authors = {}
+        self._days = {}
+
+    def author(self, name):
+        return self._authors.setdefault(name, name)
+
+    def day(self, text):
+        day = self._days.get(text)
+        if day is None:
+            # Also caches the parse, which dominates building quotes
+            day = self._days.setdefault(text, encode_date(text))
+        return day
+
+    def __len__(self):
+        return len(self._authors)
+
+
+def day_ordinal(value):
+    """Day ordinal of a date, datetime or DD/MM/YYYY string"""
+    if isinstance(value, str):
+        return datetime.strptime(value, DATE_FORMAT).toordinal()
+    return value.toordinal()
+
+
+class Quote:
+    """One quote, without the per-record dict
+
+    The date is kept as a day ordinal. Given an InternTable, quotes share
+    one object per repeated author and date, so those cost a pointer per
+    quote. Supports quote["text"] style access, and to_dict()/from_dict()
+    round-trip the JSON format exactly, unknown keys included.
+    """
+
+    __slots__ = ("id", "text", "author", "day", "extra")
+    FIELDS = ("id", "text", "author", "date")
+
+    def __init__(self, id, text, author, date, extra=None, interned=None):
+        self.id = id
+        self.text = text
+        if interned is None:
+            self.author = author
+            self.day = encode_date(date)
+        else:
+            self.author = interned.author(author)
+            self.day = interned.day(date)
+        self.extra = extra
+
+    @property
+    def date(self):
+        return decode_date(self.day)
+
+    @date.setter
+    def date(self, text):
+        self.day = encode_date(text)
+
+    @classmethod
+    def from_dict(cls, data, interned=None):
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS} or None
+        return cls(data.get("id"), data["text"], data["author"], data["date"], extra, interned)
+
+    def to_dict(self):
+        data = {"id": self.id, "text": self.text, "author": self.author, "date": self.date}
+        if self.id is None:
+            del data["id"]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Quote({self.to_dict()!r})"
+
+
+def encode_quote(obj):
+    """json.dump default= hook for Quote records"""
+    if isinstance(obj, Quote):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class _OrderedIdIndex:
+    """Insertion-ordered set of quote ids with O(1) add and position lookup
+
+    Removing an id is O(1) too; the positional list is rebuilt lazily on the
+    next positional read after a removal.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._list = []
+        self._pos = {}
+        self._stale = False
+
+    def add(self, quote_id):
+        if quote_id in self._ids:
+            return
+        self._ids[quote_id] = None
+        if not self._stale:
+            self._pos[quote_id] = len(self._list)
+            self._list.append(quote_id)
+
+    def discard(self, quote_id):
+        if self._ids.pop(quote_id, False) is None:
+            self._stale = True
+
+    def _rebuild(self):
+        if self._stale:
+            self._list = list(self._ids)
+            self._pos = {quote_id: i for i, quote_id in enumerate(self._list)}
+            self._stale = False
+
+    def ids(self):
+        self._rebuild()
+        return self._list
+
+    def position(self, quote_id):
+        self._rebuild()
+        return self._pos.get(quote_id)
+
+    def __contains__(self, quote_id):
+        return quote_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def split_authors(author):
+    """Normalized (lowercased) individual names from an "a, b" author string"""
+    return [a.strip().lower() for a in author.split(",")]
+
+
+@functools.lru_cache(maxsize=65536)
+def author_keys(author):
+    """Distinct split_authors() names; cached since most quotes share a few authors"""
+    return tuple(dict.fromkeys(split_authors(author)))
+
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write_json_atomic(path, data):
+    """Write data as pretty-printed JSON via a temp file and rename"""
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        with METRICS.timer("storage_seconds", op="encode"):
+            json.dump(data, f, ensure_ascii=False, indent=2, default=encode_quote)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_json_quotes(path):
+    if not pathlib.Path(path).exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def meta_path_for(path):
+    """Sidecar holding store metadata (next_id) next to a quotes.json"""
+    path = pathlib.Path(path)
+    return path.with_name(path.stem + ".meta.json")
+
+
+def read_meta(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def read_json_for_import(json_path):
+    """Quotes and meta of a quotes.json, with ids given to quotes that lack one"""
+    quotes = read_json_quotes(json_path)
+    next_id = max([q.get("id", 0) for q in quotes], default=0) + 1
+    next_id = max(next_id, read_meta(meta_path_for(json_path)).get("next_id", 1))
+    for q in quotes:
+        if "id" not in q:
+            q["id"] = next_id
+            next_id += 1
+    return quotes, {"next_id": next_id}
+
+
+# -------------------------------
+# Storage backends
+# -------------------------------
+class JsonBackend:
+    """Rewrites the whole quotes.json on every mutation"""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.meta_path = meta_path_for(self.path)
+        self._signature = None
+        self._meta = {}
+
+    def signature(self):
+        return _stat_mtime(self.path)
+
+    def changed(self):
+        """True if the file was modified by something other than us"""
+        return self.signature() != self._signature
+
+    def load(self):
+        quotes = read_json_quotes(self.path)
+        self._meta = read_meta(self.meta_path)
+        self._signature = self.signature()
+        return quotes, self._meta
+
+    def rewrite(self, store):
+        # Metadata goes first: a crash in between can only skip ids, never reuse them
+        meta = store.meta()
+        if meta != self._meta:
+            write_json_atomic(self.meta_path, meta)
+            self._meta = meta
+        write_json_atomic(self.path, store.quotes)
+        self._signature = self.signature()
+
+    def commit(self, ops, store):
+        self.rewrite(store)
+
+    def close(self):
+        pass
+
+
+class JournalBackend:
+    """quotes.json snapshot plus an append-only log of mutations
+
+    Each mutation is appended as one JSON line, so writes cost O(1). Once the
+    log grows past compact_threshold bytes, a background thread folds it into
+    a fresh snapshot. Replay is idempotent, so a crash at any point of
+    compaction loses nothing.
+    """
+
+    def __init__(self, path, compact_threshold=1024 * 1024):
+        self.path = pathlib.Path(path)
+        self.meta_path = meta_path_for(self.path)
+        self.journal_path = self.path.with_name(self.path.stem + ".journal")
+        self.compacting_path = self.path.with_name(self.path.stem + ".journal.compacting")
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compactor = None
+        self._journal = None
+        self._signature = None
+
+    def signature(self):
+        return (_stat_mtime(self.path), _stat_mtime(self.journal_path))
+
+    def changed(self):
+        with self._lock:
+            signature = self.signature()
+            if self._compactor is not None and self._compactor.is_alive():
+                # Our own compactor is rewriting the snapshot; only the journal can tell
+                return signature[1] != self._signature[1]
+            return signature != self._signature
+
+    def load(self):
+        self.wait_for_compaction()
+        with self._lock:
+            meta = read_meta(self.meta_path)
+            by_id = {}
+            order = []
+            for q in read_json_quotes(self.path):
+                key = q.get("id", ("unnumbered", len(order)))
+                by_id[key] = q
+                order.append(key)
+
+            # Ids added in the journal count as allocated even if deleted later
+            next_id = meta.get("next_id", 1)
+            for journal in (self.compacting_path, self.journal_path):
+                self._truncate_torn_record(journal)
+                for op in self._read_journal(journal):
+                    self._replay(op, by_id, order)
+                    if op.get("op") == "add":
+                        next_id = max(next_id, op["quote"]["id"] + 1)
+
+            self._signature = self.signature()
+            quotes = [by_id[key] for key in order if key in by_id]
+            return quotes, dict(meta, next_id=next_id)
+
+    @staticmethod
+    def _truncate_torn_record(path, chunk_size=64 * 1024):
+        """Cut an unterminated last record (a crash mid-append) off the file
+
+        Otherwise the next append would continue that line and be lost with it.
+        """
+        try:
+            f = open(path, "rb+")
+        except FileNotFoundError:
+            return
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - chunk_size)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end == size:
+                return
+            print(f"Dropping truncated journal record at the end of {path.name}")
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _read_journal(path):
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Left behind by older versions, which appended after a torn record
+                    print(f"Skipping unreadable journal record on line {line_number} of {path.name}")
+
+    @staticmethod
+    def _replay(op, by_id, order):
+        kind = op.get("op")
+        if kind == "add":
+            quote = op["quote"]
+            if quote["id"] not in by_id:
+                order.append(quote["id"])
+            by_id[quote["id"]] = quote
+        elif kind == "edit":
+            quote = by_id.get(op["id"])
+            if quote is not None:
+                quote["text"] = op["text"]
+        elif kind == "delete":
+            by_id.pop(op["id"], None)
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return self._journal
+
+    def commit(self, ops, store):
+        with self._lock:
+            journal = self._open_journal()
+            for op in ops:
+                journal.write(json.dumps(op, ensure_ascii=False, default=encode_quote) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+            self._signature = self.signature()
+            size = journal.tell()
+
+        if size >= self.compact_threshold:
+            self.compact(store)
+
+    def compact(self, store, wait=False):
+        """Fold the journal into a new snapshot on a background thread"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.journal_path.exists():
+                if self.compacting_path.exists():
+                    # A previous compaction failed; keep its records too
+                    with open(self.compacting_path, "a", encoding="utf-8") as dst, \
+                            open(self.journal_path, "r", encoding="utf-8") as src:
+                        shutil.copyfileobj(src, dst)
+                    self.journal_path.unlink()
+                else:
+                    os.replace(self.journal_path, self.compacting_path)
+                self._signature = self.signature()
+            snapshot = [q.to_dict() for q in store.quotes]
+            self._compactor = threading.Thread(
+                target=self._write_snapshot, args=(snapshot, store.meta()), name="journal-compactor", daemon=True
+            )
+            self._compactor.start()
+
+        if wait:
+            self.wait_for_compaction()
+
+    def _write_snapshot(self, snapshot, meta):
+        try:
+            write_json_atomic(self.meta_path, meta)
+            write_json_atomic(self.path, snapshot)
+            with self._lock:
+                self.compacting_path.unlink(missing_ok=True)
+                self._signature = self.signature()
+        except Exception as e:
+            print(f"Error compacting journal: {e}")
+
+    def wait_for_compaction(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def rewrite(self, store):
+        self.compact(store, wait=True)
+
+    def close(self):
+        self.wait_for_compaction()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class SQLiteBackend:
+    """Quotes in a WAL-mode SQLite database
+
+    id is the primary key, so single-quote writes touch one row. Lookups are
+    served by the store's in-memory indexes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL,
+            author TEXT NOT NULL,
+            date TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path, import_from=None):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._drop_unused_schema()
+        self._conn.executescript(self.SCHEMA)
+        self._signature = None
+
+        # Every write records next_id in meta, so a database that has ever been
+        # used isn't refilled from the JSON even after all its quotes are deleted
+        if import_from is not None and self._is_new() and pathlib.Path(import_from).exists():
+            self.migrate_from_json(import_from)
+
+    def _drop_unused_schema(self):
+        """Drop the author table and status column older versions wrote but never read"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(quotes)")]
+        if "fits_status" not in columns:
+            return
+        # Rebuilt rather than ALTER TABLE ... DROP COLUMN, which needs SQLite 3.35
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DROP TABLE IF EXISTS quote_authors")
+            self._conn.execute("DROP INDEX IF EXISTS idx_quotes_fits_status")
+            self._conn.execute(
+                "CREATE TABLE quotes_upgraded (id INTEGER PRIMARY KEY, text TEXT NOT NULL, "
+                "author TEXT NOT NULL, date TEXT NOT NULL)"
+            )
+            self._conn.execute("INSERT INTO quotes_upgraded SELECT id, text, author, date FROM quotes")
+            self._conn.execute("DROP TABLE quotes")
+            self._conn.execute("ALTER TABLE quotes_upgraded RENAME TO quotes")
+
+    def _is_new(self):
+        return self._conn.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM quotes) AND NOT EXISTS (SELECT 1 FROM meta)"
+        ).fetchone()[0]
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of an existing quotes.json"""
+        quotes, meta = read_json_for_import(json_path)
+        self._write_all(quotes, dict(meta, migrated_from_json=1))
+        print(f"Migrated {len(quotes)} quotes from {pathlib.Path(json_path).name} to {self.path.name}")
+
+    def signature(self):
+        # data_version only changes when another connection commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed(self):
+        with self._lock:
+            return self.signature() != self._signature
+
+    def load(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, text, author, date FROM quotes ORDER BY id").fetchall()
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            self._signature = self.signature()
+        # Every row comes with its own copy of the author and date strings
+        interned = InternTable()
+        return [Quote(*row, interned=interned) for row in rows], meta
+
+    def _write_meta(self, meta):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", list(meta.items())
+        )
+
+    def _insert(self, quote):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO quotes (id, text, author, date) VALUES (?, ?, ?, ?)",
+            (quote["id"], quote["text"], quote["author"], quote["date"])
+        )
+
+    def _apply(self, op):
+        kind = op["op"]
+        if kind == "add":
+            self._insert(op["quote"])
+        elif kind == "edit":
+            self._conn.execute("UPDATE quotes SET text = ? WHERE id = ?", (op["text"], op["id"]))
+        elif kind == "delete":
+            self._conn.execute("DELETE FROM quotes WHERE id = ?", (op["id"],))
+
+    def commit(self, ops, store):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                for op in ops:
+                    self._apply(op)
+                self._write_meta(store.meta())
+            self._signature = self.signature()
+
+    def _write_all(self, quotes, meta):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM quotes")
+                for quote in quotes:
+                    self._insert(quote)
+                self._write_meta(meta)
+            self._signature = self.signature()
+
+    def rewrite(self, store):
+        self._write_all(store.quotes, store.meta())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Binary snapshot layout (little endian):
+#   header         magic, version, next_id, quote count, author count, date count
+#   author table   distinct author strings, each u32 length + UTF-8
+#   date table     distinct date strings, the same way
+#   index          one fixed-size entry per quote: id, author and date table
+#                  positions, record offset, flags
+#   records        u32 record length, u32 text length, text, extra keys as JSON
+SNAPSHOT_MAGIC = b"QREDSNAP"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sIqIII")
+_SNAPSHOT_ENTRY = struct.Struct("<qIIQB")
+_SNAPSHOT_RECORD = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+SNAPSHOT_FITS_STATUS = 1
+SNAPSHOT_HAS_EXTRA = 2
+# Guards lazily decoded text against concurrent edits
+_LAZY_TEXT_LOCK = threading.Lock()
+_TEXT_SLOT = Quote.text
+
+
+class SnapshotFile:
+    """A memory-mapped snapshot; records are only read when asked for"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{pathlib.Path(path).name} is empty, not a quote snapshot")
+
+    def record(self, offset):
+        """(text, extra JSON bytes) of the record at offset"""
+        length, text_length = _SNAPSHOT_RECORD.unpack_from(self.map, offset)
+        start = offset + _SNAPSHOT_RECORD.size
+        text = self.map[start:start + text_length].decode("utf-8")
+        return text, self.map[start + text_length:offset + _U32.size + length]
+
+    def text(self, offset):
+        return self.record(offset)[0]
+
+    def close(self):
+        self.map.close()
+        self._file.close()
+
+
+class SnapshotQuote(Quote):
+    """Quote loaded from a snapshot, whose text is decoded on first access"""
+
+    __slots__ = ("_source", "_offset", "fits_status")
+
+    @property
+    def text(self):
+        if self._source is not None:
+            with _LAZY_TEXT_LOCK:
+                if self._source is not None:
+                    _TEXT_SLOT.__set__(self, self._source.text(self._offset))
+                    self._source = None
+        return _TEXT_SLOT.__get__(self)
+
+    @text.setter
+    def text(self, value):
+        with _LAZY_TEXT_LOCK:
+            _TEXT_SLOT.__set__(self, value)
+            self._source = None
+            # The snapshot's flag was for the old text
+            self.fits_status = None
+
+
+def _read_strings(buffer, offset, count):
+    strings = []
+    for _ in range(count):
+        (length,) = _U32.unpack_from(buffer, offset)
+        offset += _U32.size
+        strings.append(buffer[offset:offset + length].decode("utf-8"))
+        offset += length
+    return strings, offset
+
+
+def _write_strings(f, strings):
+    for string in strings:
+        encoded = string.encode("utf-8")
+        f.write(_U32.pack(len(encoded)))
+        f.write(encoded)
+
+
+def write_snapshot(path, quotes, meta):
+    """Write quotes (Quote records or dicts) as a binary snapshot via a temp file and rename"""
+    path = pathlib.Path(path)
+    quotes = [q if isinstance(q, Quote) else Quote.from_dict(q) for q in quotes]
+    authors = {}
+    dates = {}
+    entries = bytearray()
+    records = bytearray()
+    for q in quotes:
+        text = q.text.encode("utf-8")
+        extra = json.dumps(q.extra, ensure_ascii=False).encode("utf-8") if q.extra else b""
+        flags = SNAPSHOT_FITS_STATUS if fits_status(q) else 0
+        if extra:
+            flags |= SNAPSHOT_HAS_EXTRA
+        author = authors.setdefault(q.author, len(authors))
+        date = dates.setdefault(q.date, len(dates))
+        entries += _SNAPSHOT_ENTRY.pack(q.id, author, date, len(records), flags)
+        records += _SNAPSHOT_RECORD.pack(_U32.size + len(text) + len(extra), len(text))
+        records += text
+        records += extra
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, meta.get("next_id", 1), len(quotes), len(authors), len(dates)
+        ))
+        _write_strings(f, authors)
+        _write_strings(f, dates)
+        f.write(entries)
+        f.write(records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path):
+    """(lazily decoded quotes, mapped file, meta) from a binary snapshot
+
+    Only the header, string tables and index are read; quote text stays in
+    the mapped file until something accesses it.
+    """
+    source = SnapshotFile(path)
+    buffer = source.map
+    magic, version, next_id, count, author_count, date_count = _SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        source.close()
+        raise ValueError(f"{pathlib.Path(path).name} is not a version {SNAPSHOT_VERSION} quote snapshot")
+    authors, offset = _read_strings(buffer, _SNAPSHOT_HEADER.size, author_count)
+    dates, offset = _read_strings(buffer, offset, date_count)
+    days = [encode_date(date) for date in dates]
+    records_start = offset + count * _SNAPSHOT_ENTRY.size
+
+    quotes = []
+    new = SnapshotQuote.__new__
+    index = memoryview(buffer)[offset:records_start]
+    try:
+        for quote_id, author, date, record, flags in _SNAPSHOT_ENTRY.iter_unpack(index):
+            q = new(SnapshotQuote)
+            q.id = quote_id
+            q.author = authors[author]
+            q.day = days[date]
+            q.fits_status = bool(flags & SNAPSHOT_FITS_STATUS)
+            q._source = source
+            q._offset = records_start + record
+            if flags & SNAPSHOT_HAS_EXTRA:
+                q.extra = json.loads(source.record(q._offset)[1])
+            else:
+                q.extra = None
+            quotes.append(q)
+    finally:
+        index.release()
+    return quotes, source, {"next_id": next_id}
+
+
+class SnapshotBackend:
+    """Whole-store binary snapshot, memory-mapped on load
+
+    Cold starts skip JSON parsing, the id backfill and the text indexes:
+    quotes come back with their text still in the mapped file and the status
+    pool from precomputed flags, while the search index is built on the
+    first search. Every commit rewrites the snapshot, like JsonBackend.
+    """
+
+    lazy_text = True
+
+    def __init__(self, path, import_from=None):
+        self.path = pathlib.Path(path)
+        self._source = None
+        self._signature = None
+        if import_from is not None and not self.path.exists() and pathlib.Path(import_from).exists():
+            self.migrate_from_json(import_from)
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of an existing quotes.json"""
+        quotes, meta = read_json_for_import(json_path)
+        write_snapshot(self.path, quotes, meta)
+        print(f"Migrated {len(quotes)} quotes from {pathlib.Path(json_path).name} to {self.path.name}")
+
+    def signature(self):
+        return _stat_mtime(self.path)
+
+    def changed(self):
+        return self.signature() != self._signature
+
+    def load(self):
+        self._signature = self.signature()
+        if self._signature is None:
+            return [], {}
+        quotes, self._source, meta = read_snapshot(self.path)
+        return quotes, meta
+
+    def rewrite(self, store):
+        # Writing decodes every quote's text, after which nothing needs the old mapping
+        if self._source is not None:
+            if os.name == "nt":
+                # Windows can't replace a mapped file, so unmap it first
+                for q in store.quotes:
+                    q.text
+                self._source.close()
+            self._source = None
+        write_snapshot(self.path, store.quotes, store.meta())
+        self._signature = self.signature()
+
+    def commit(self, ops, store):
+        self.rewrite(store)
+
+    def close(self):
+        # Quotes still being read keep their mapping alive until they are collected
+        self._source = None
+
+
+def open_backend(kind, path, **options):
+    """Open a storage backend; path is the quotes.json location"""
+    if kind == "json":
+        return JsonBackend(path)
+    if kind == "journal":
+        return JournalBackend(path, **options)
+    if kind == "sqlite":
+        path = pathlib.Path(path)
+        return SQLiteBackend(path.with_suffix(".db"), import_from=path, **options)
+    if kind == "snapshot":
+        path = pathlib.Path(path)
+        return SnapshotBackend(path.with_suffix(".snap"), import_from=path, **options)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+# -------------------------------
+# Full-text search
+# -------------------------------
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercased, accent-folded word tokens with Discord mentions removed"""
+    text = unicodedata.normalize("NFKD", clean_quote_text(text).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text)
+
+
+def _trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Token inverted index over quote text and authors
+
+    Postings map token -> {quote_id: term frequency} and results are ranked
+    by tf-idf. With fuzzy enabled, a trigram index over the vocabulary (not
+    over every quote) resolves misspelled or partial query tokens to known
+    tokens, so substring matches stay cheap on large corpora.
+    """
+
+    def __init__(self, fuzzy=True):
+        self._postings = {}
+        self._doc_tokens = {}
+        self._doc_lengths = {}
+        self._trigrams = {} if fuzzy else None
+        # Sorted vocabulary for prefix lookups, built on first use
+        self._vocabulary = None
+
+    def add(self, quote_id, text, author):
+        tokens = tokenize(text) + tokenize(author)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        for token, tf in counts.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, token)
+                if self._trigrams is not None:
+                    for gram in _trigrams(token):
+                        self._trigrams.setdefault(gram, set()).add(token)
+            postings[quote_id] = tf
+
+        self._doc_tokens[quote_id] = tuple(counts)
+        self._doc_lengths[quote_id] = len(tokens)
+
+    def remove(self, quote_id):
+        self._doc_lengths.pop(quote_id, None)
+        for token in self._doc_tokens.pop(quote_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(quote_id, None)
+            if not postings:
+                del self._postings[token]
+                if self._vocabulary is not None:
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                if self._trigrams is not None:
+                    for gram in _trigrams(token):
+                        vocab = self._trigrams.get(gram)
+                        if vocab is not None:
+                            vocab.discard(token)
+                            if not vocab:
+                                del self._trigrams[gram]
+
+    def tokens_of(self, quote_id):
+        return self._doc_tokens.get(quote_id, ())
+
+    def postings(self, token):
+        """Ids of the quotes containing token"""
+        return self._postings.get(token, {})
+
+    def prefix_tokens(self, prefix):
+        """Known tokens starting with prefix, in sorted order"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        for i in range(bisect.bisect_left(vocabulary, prefix), len(vocabulary)):
+            if not vocabulary[i].startswith(prefix):
+                return
+            yield vocabulary[i]
+
+    def _fuzzy_tokens(self, token, min_similarity=0.4, max_candidates=5):
+        """Known tokens most similar to token by trigram Jaccard similarity"""
+        grams = _trigrams(token)
+        shared = {}
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        scored = []
+        for candidate, count in shared.items():
+            # A padded token of length n has n trigrams
+            similarity = count / (len(grams) + len(candidate) - count)
+            if similarity >= min_similarity:
+                scored.append((similarity, candidate))
+        return [(candidate, similarity) for similarity, candidate in heapq.nlargest(max_candidates, scored)]
+
+    def search(self, query, limit=10):
+        """Best matching quote ids for query as (quote_id, score) pairs"""
+        doc_count = len(self._doc_tokens)
+        if not doc_count:
+            return []
+
+        scores = {}
+        for token in set(tokenize(query)):
+            if token in self._postings:
+                matches = [(token, 1.0)]
+            elif self._trigrams is not None:
+                matches = self._fuzzy_tokens(token)
+            else:
+                matches = []
+
+            for match, weight in matches:
+                postings = self._postings[match]
+                idf = math.log(1 + doc_count / len(postings)) * weight
+                for quote_id, tf in postings.items():
+                    score = idf * tf / math.sqrt(self._doc_lengths[quote_id])
+                    scores[quote_id] = scores.get(quote_id, 0.0) + score
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+# -------------------------------
+# Background persistence
+# -------------------------------
+class _Snapshot:
+    """View of a store handed to a backend off the event loop
+
+    Only backends that rewrite everything (JSON, snapshot, journal
+    compaction) read quotes, so the list is copied then rather than on every
+    flush. The copy may include mutations queued after the flushed ops;
+    writing those early is harmless, as they are redone idempotently later.
+    """
+
+    def __init__(self, store, meta):
+        self._store = store
+        self._meta = meta
+        self._quotes = None
+
+    @property
+    def quotes(self):
+        if self._quotes is None:
+            with self._store._lock:
+                self._quotes = list(self._store.quotes)
+        return self._quotes
+
+    def meta(self):
+        return self._meta
+
+
+class BackgroundWriter:
+    """Flushes a QuoteStore on a worker thread
+
+    A flush happens once `delay` seconds have passed since the first unflushed
+    mutation, or as soon as `max_pending` mutations have piled up, so a burst
+    of commands results in a single write.
+    """
+
+    def __init__(self, store, delay=2.0, max_pending=50):
+        self.store = store
+        self.delay = delay
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._dirty_since = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="quote-writer", daemon=True)
+        self._thread.start()
+
+    def notify(self, count=1):
+        with self._cond:
+            self._pending += count
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._pending < self.max_pending:
+                    if self._dirty_since is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._dirty_since + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+                self._pending = 0
+                self._dirty_since = None
+
+            self.store.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Stop the worker after a final flush"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+
+# -------------------------------
+# Quote store
+# -------------------------------
+class QuoteStore:
+    """Long-lived in-memory quote collection with write-behind persistence
+
+    Quotes are kept in an id -> quote dict (insertion ordered), so lookups by
+    id are O(1). Ids come from a monotonic counter persisted by the backend,
+    so ids of deleted quotes are never handed out again. Author strings are
+    split once per quote into a normalized-name -> quote ids inverted index,
+    and whether each quote's status string fits decides whether it joins an
+    ordered pool of quotes for the bot status. A SearchIndex is kept alongside.
+
+    Mutations are queued and written by flush(): immediately when no writer
+    is attached, otherwise by a BackgroundWriter on its own thread.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.writer = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._by_id = {}
+        self._by_author = {}
+        self._author_keys = {}
+        self._status_pool = _OrderedIdIndex()
+        self._search = SearchIndex()
+        self._search_dirty = None
+        self._search_warmer = None
+        self._generation = 0
+        self._unindexed = []
+        self._sorted_ids = None
+        self._author_names = None
+        self._list = None
+        self._interned = InternTable()
+        self._next_id = 1
+        self.load()
+
+    @property
+    def quotes(self):
+        """All quotes in insertion order"""
+        if self._list is None:
+            self._list = list(self._by_id.values())
+        return self._list
+
+    def meta(self):
+        return {"next_id": self._next_id}
+
+    def load(self, pending=()):
+        """Read quotes from storage, assigning ids to quotes that lack one
+
+        pending are queued mutations not written yet; they are redone on top
+        of what was read, so an outside edit and our own changes both survive.
+        """
+        try:
+            with METRICS.timer("storage_seconds", op="load"):
+                quotes, meta = self.backend.load()
+        except json.JSONDecodeError as e:
+            print(f"Error loading quotes: {e}")
+            quotes, meta = [], {}
+
+        lazy = getattr(self.backend, "lazy_text", False)
+        # A fresh table, so authors and dates only the old quotes had are let go
+        interned = InternTable()
+        if not lazy:
+            quotes = [q if isinstance(q, Quote) else Quote.from_dict(q, interned) for q in quotes]
+        if pending:
+            quotes = self._redo(quotes, pending)
+        next_id = max([q.id or 0 for q in quotes], default=0) + 1
+        # Ids handed out for queued changes stay taken even if those quotes are gone
+        self._next_id = max(next_id, meta.get("next_id", 1), self._next_id if pending else 1)
+
+        needs_save = False
+        for q in quotes:
+            if q.id is None:
+                q.id = self._allocate_id()
+                needs_save = True
+
+        with self._lock:
+            self._generation += 1
+            self._by_id = {}
+            self._by_author = {}
+            self._author_keys = {}
+            self._status_pool = _OrderedIdIndex()
+            # Indexing text would decode all of it; a background thread does that instead
+            self._search = None if lazy else SearchIndex()
+            self._search_dirty = None
+            with METRICS.timer("storage_seconds", op="index"):
+                for q in quotes:
+                    self._by_id[q.id] = q
+                    self._index(q, q.fits_status if lazy else None)
+            self._unindexed = []
+            self._sorted_ids = None
+            self._author_names = None
+            self._list = None
+            self._interned = interned
+        if lazy:
+            self._search_warmer = threading.Thread(
+                target=self._build_search, args=(self._generation,), name="search-index", daemon=True
+            )
+            self._search_warmer.start()
+        if needs_save:
+            try:
+                self.backend.rewrite(self)
+            except Exception as e:
+                print(f"Error saving quotes: {e}")
+
+    @staticmethod
+    def _redo(quotes, ops):
+        """quotes with queued ops applied; says so when an op overrides an outside change"""
+        by_id = {q.id: q for q in quotes if q.id is not None}
+        unnumbered = [q for q in quotes if q.id is None]
+        for op in ops:
+            kind = op["op"]
+            if kind == "add":
+                quote = op["quote"]
+                if quote.id in by_id:
+                    print(f"Quote #{quote.id} was also added outside the bot; keeping the bot's version")
+                by_id[quote.id] = quote
+            elif kind == "edit":
+                quote = by_id.get(op["id"])
+                if quote is None:
+                    print(f"Quote #{op['id']} was deleted outside the bot; dropping the bot's edit to it")
+                else:
+                    quote.text = op["text"]
+            elif kind == "delete":
+                by_id.pop(op["id"], None)
+        return list(by_id.values()) + unnumbered
+
+    def _index(self, quote, fits=None):
+        keys = author_keys(quote.author)
+        self._author_keys[quote.id] = keys
+        for key in keys:
+            # dicts double as insertion-ordered sets of quote ids
+            ids = self._by_author.get(key)
+            if ids is None:
+                ids = self._by_author[key] = {}
+                if self._author_names is not None:
+                    bisect.insort(self._author_names, key)
+            ids[quote.id] = None
+        self._index_status(quote, fits)
+        if self._search is not None:
+            self._search.add(quote.id, quote.text, quote.author)
+        elif self._search_dirty is not None:
+            self._search_dirty.add(quote.id)
+
+    def _index_status(self, quote, fits=None):
+        """Add the quote to the status pool if it fits; fits may be known already"""
+        if fits is None:
+            fits = fits_status(quote)
+        if fits:
+            self._status_pool.add(quote.id)
+        else:
+            self._status_pool.discard(quote.id)
+
+    def _build_search(self, generation):
+        """Build the search index after a lazy load, catching up on changes made meanwhile"""
+        with self._lock:
+            if generation != self._generation or self._search is not None:
+                return
+            quotes = list(self._by_id.values())
+            self._search_dirty = set()
+        search = SearchIndex()
+        with METRICS.timer("storage_seconds", op="index"):
+            for q in quotes:
+                search.add(q.id, q.text, q.author)
+        with self._lock:
+            if generation != self._generation or self._search is not None:
+                return
+            for quote_id in self._search_dirty:
+                search.remove(quote_id)
+                quote = self._by_id.get(quote_id)
+                if quote is not None:
+                    search.add(quote_id, quote.text, quote.author)
+            self._search = search
+            self._search_dirty = None
+
+    def _search_index(self):
+        """The search index, waiting for it if it's still being built"""
+        if self._search is None:
+            warmer = self._search_warmer
+            if warmer is not None and warmer is not threading.current_thread():
+                warmer.join()
+            if self._search is None:
+                self._build_search(self._generation)
+        return self._search
+
+    def _unindex(self, quote):
+        if self._search is not None:
+            self._search.remove(quote.id)
+        elif self._search_dirty is not None:
+            self._search_dirty.add(quote.id)
+        self._status_pool.discard(quote.id)
+        for key in self._author_keys.pop(quote.id, ()):
+            ids = self._by_author.get(key)
+            if ids is not None:
+                ids.pop(quote.id, None)
+                if not ids:
+                    del self._by_author[key]
+                    if self._author_names is not None:
+                        del self._author_names[bisect.bisect_left(self._author_names, key)]
+
+    def _allocate_id(self):
+        quote_id = self._next_id
+        self._next_id += 1
+        return quote_id
+
+    def start_writer(self, delay=2.0, max_pending=50):
+        """Move persistence off the calling thread onto a BackgroundWriter"""
+        self.writer = BackgroundWriter(self, delay=delay, max_pending=max_pending)
+
+    def _commit(self, op):
+        self._commit_many([op])
+
+    def _commit_many(self, ops):
+        with self._lock:
+            self._pending.extend(ops)
+        if self.writer is not None:
+            self.writer.notify(len(ops))
+        else:
+            self.flush()
+
+    def flush(self):
+        """Write all queued mutations to storage"""
+        with self._flush_lock:
+            # Writing now would overwrite an outside edit; refresh() reloads and redoes the queue first
+            if self.backend.changed():
+                return
+            with self._lock:
+                if not self._pending:
+                    return
+                ops = self._pending
+                self._pending = []
+                snapshot = _Snapshot(self, self.meta())
+            try:
+                with METRICS.timer("storage_seconds", op="save"):
+                    self.backend.commit(ops, snapshot)
+            except Exception as e:
+                print(f"Error saving quotes: {e}")
+                # Keep them queued for the next flush
+                with self._lock:
+                    self._pending[:0] = ops
+
+    def stale(self):
+        """True if storage was changed outside the bot, so refresh() would reload"""
+        # While we are writing, any change on disk is our own
+        return not self._flush_lock.locked() and self.backend.changed()
+
+    def refresh(self):
+        """Reload only if storage was changed outside the bot
+
+        Queued mutations were already acknowledged, so they are redone on top
+        of the reloaded quotes and then written, rather than written first
+        over the outside change.
+        """
+        if not self.stale():
+            return
+        with self._flush_lock:
+            if not self.backend.changed():
+                return
+            with self._lock:
+                pending = self._pending
+                self._pending = []
+            try:
+                self.load(pending)
+            finally:
+                with self._lock:
+                    self._pending[:0] = pending
+        if pending:
+            self.flush()
+
+    def close(self):
+        """Force a final flush and release storage"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        # A change made outside since the last read would otherwise keep the final flush from writing
+        self.refresh()
+        self.flush()
+        self.backend.close()
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    def all(self):
+        self.refresh()
+        return self.quotes
+
+    def get(self, quote_id):
+        self.refresh()
+        return self._by_id.get(quote_id)
+
+    def id_bound(self):
+        """Every id allocated so far is below this"""
+        return self._next_id
+
+    def quote_at(self, position):
+        """Quote at position in insertion order (wrapping around), or None if empty"""
+        quotes = self.all()
+        if not quotes:
+            return None
+        return quotes[position % len(quotes)]
+
+    def count_by_author(self, name):
+        """How many quotes credit name (case-insensitive), including multi-author quotes"""
+        self.refresh()
+        return len(self._by_author.get(name.strip().lower(), ()))
+
+    def is_author(self, quote_id, name):
+        """Whether name (case-insensitive) is one of the quote's authors"""
+        self.refresh()
+        return quote_id in self._by_author.get(name.strip().lower(), {})
+
+    def between(self, start, end):
+        """Quotes dated start to end inclusive (dates or DD/MM/YYYY strings)"""
+        first, last = day_ordinal(start), day_ordinal(end)
+        self.refresh()
+        # Undated or oddly formatted quotes keep their date as a string and never match
+        return [q for q in self._by_id.values() if type(q.day) is int and first <= q.day <= last]
+
+    def page(self, after_id=0, limit=1000, author=None):
+        """Up to limit quotes with ids above after_id, in id order; only author's if given
+
+        Lets exports and quote lists walk a namespace in bounded chunks while it
+        keeps changing.
+        """
+        self.refresh()
+        if author is not None:
+            ids = self._by_author.get(author.strip().lower(), {})
+            return self._take(heapq.nsmallest(limit, (quote_id for quote_id in ids if quote_id > after_id)), limit)
+        ids = self._ids_in_order()
+        return self._take((ids[i] for i in range(bisect.bisect_right(ids, after_id), len(ids))), limit)
+
+    def _ids_in_order(self):
+        """Sorted quote ids; may still hold some deleted ones"""
+        ids = self._sorted_ids
+        if ids is None or len(ids) > 2 * len(self._by_id) + 1000:
+            # Deleted ids are skipped by readers and only pruned now and then
+            ids = self._sorted_ids = sorted(self._by_id)
+        return ids
+
+    def _take(self, ids, limit):
+        """The first limit distinct existing quotes among ids"""
+        quotes = []
+        seen = set()
+        for quote_id in ids:
+            quote = self._by_id.get(quote_id)
+            if quote is not None and quote_id not in seen:
+                seen.add(quote_id)
+                quotes.append(quote)
+                if len(quotes) >= limit:
+                    break
+        return quotes
+
+    def _ids_with_prefix(self, prefix):
+        """Ids whose decimal form starts with prefix, shortest first"""
+        if prefix.startswith("0"):
+            return
+        ids = self._ids_in_order()
+        low = high = int(prefix)
+        while ids and low <= ids[-1]:
+            for i in range(bisect.bisect_left(ids, low), bisect.bisect_right(ids, high)):
+                yield ids[i]
+            low, high = low * 10, high * 10 + 9
+
+    def suggest(self, typed, author=None, limit=25):
+        """Quotes matching a partly typed id or text, for autocomplete
+
+        Digits (optionally after a #) match the start of ids; anything else
+        matches words of the text and author, the last word as a prefix.
+        With author set only that author's quotes are considered, newest
+        first. Nothing typed yet gives the newest quotes.
+        """
+        self.refresh()
+        candidates = None
+        if author is not None:
+            candidates = reversed(self._by_author.get(author.strip().lower(), {}))
+        digits = typed.strip().lstrip("#")
+        if not typed.strip():
+            if candidates is None:
+                ids = self._ids_in_order()
+                candidates = (ids[i] for i in range(len(ids) - 1, -1, -1))
+            return self._take(candidates, limit)
+        if digits.isdigit():
+            if candidates is None:
+                return self._take(self._ids_with_prefix(digits), limit)
+            return self._take((quote_id for quote_id in candidates if str(quote_id).startswith(digits)), limit)
+
+        search = self._search
+        words = tokenize(typed)
+        if search is None or not words:
+            # No index yet (still being built after a lazy load) or nothing searchable typed
+            return []
+        # A trailing space means the last word is complete
+        partial = None if typed[-1].isspace() else words.pop()
+        if candidates is None:
+            # Walk whichever is fewer: the quotes of the rarest complete word or
+            # those with a word starting with the partial one
+            pools = [(len(postings), postings) for postings in map(search.postings, words)]
+            if partial is not None:
+                prefixed = [search.postings(token) for token in search.prefix_tokens(partial)]
+                pools.append((sum(map(len, prefixed)), (quote_id for postings in prefixed for quote_id in postings)))
+            candidates = min(pools, key=lambda pool: pool[0])[1]
+
+        def matches(quote_id):
+            tokens = search.tokens_of(quote_id)
+            if not all(word in tokens for word in words):
+                return False
+            return partial is None or any(token.startswith(partial) for token in tokens)
+
+        return self._take((quote_id for quote_id in candidates if matches(quote_id)), limit)
+
+    def suggest_authors(self, typed, limit=25):
+        """Author names starting with typed (case-insensitive), for autocomplete"""
+        self.refresh()
+        if self._author_names is None:
+            self._author_names = sorted(self._by_author)
+        names = self._author_names
+        prefix = typed.strip().lower()
+        suggestions = []
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            key = names[i]
+            if not key.startswith(prefix) or len(suggestions) >= limit:
+                break
+            # Spelled the way the newest quote credits them
+            credited = self._by_id[next(reversed(self._by_author[key]))].author
+            suggestions.append(next((name.strip() for name in credited.split(",") if name.strip().lower() == key), key))
+        return suggestions
+
+    def search(self, query, limit=10):
+        """Quotes ranked by relevance to a free-text query"""
+        self.refresh()
+        return [self._by_id[quote_id] for quote_id, _ in self._search_index().search(query, limit)]
+
+    def status_count(self):
+        self.refresh()
+        return len(self._status_pool)
+
+    def status_quote_at(self, position):
+        """Status-pool quote at position (wrapping around), or None if the pool is empty"""
+        self.refresh()
+        ids = self._status_pool.ids()
+        if not ids:
+            return None
+        return self._by_id[ids[position % len(ids)]]
+
+    def status_position(self, quote_id):
+        """Position of a quote in the status pool, or None if it isn't in it"""
+        self.refresh()
+        return self._status_pool.position(quote_id)
+
+    def status_text(self, quote):
+        """'"cleaned text" - author' status string for a quote
+
+        Formatted on demand: presence updates are rate-limited, and keeping a
+        string per quote would cost about as much memory as the quotes' text.
+        """
+        return format_status_text(quote)
+
+    # -------------------------------
+    # Mutations (queued for the writer)
+    # -------------------------------
+    def add(self, text, author, date):
+        self.refresh()
+        with self._lock:
+            quote = Quote(self._allocate_id(), text, author, date, interned=self._interned)
+            self._by_id[quote.id] = quote
+            self._index(quote)
+            if self._list is not None:
+                self._list.append(quote)
+            if self._sorted_ids is not None:
+                self._sorted_ids.append(quote.id)
+        self._commit({"op": "add", "quote": quote})
+        return quote
+
+    def import_batch(self, records):
+        """Add already validated quote dicts under consecutive new ids, committed together
+
+        Their ids are taken in one step and any ids in the records are
+        ignored. The quotes can be fetched by id straight away, but they are
+        only indexed (authors, status, search) by finish_import(), so a large
+        import pays for indexing once instead of per batch.
+        """
+        self.refresh()
+        with self._lock:
+            first_id = self._next_id
+            self._next_id += len(records)
+            batch = [
+                Quote(
+                    first_id + i, r["text"], r["author"], r["date"],
+                    {k: v for k, v in r.items() if k not in Quote.FIELDS} or None, self._interned
+                )
+                for i, r in enumerate(records)
+            ]
+            for quote in batch:
+                self._by_id[quote.id] = quote
+            self._unindexed.extend(batch)
+            if self._list is not None:
+                self._list.extend(batch)
+            if self._sorted_ids is not None:
+                self._sorted_ids.extend(quote.id for quote in batch)
+        self._commit_many([{"op": "add", "quote": quote} for quote in batch])
+        return [quote.id for quote in batch]
+
+    def unindexed(self):
+        """How many imported quotes finish_import() has yet to index"""
+        return len(self._unindexed)
+
+    def finish_import(self, limit=None):
+        """Index what import_batch() added, oldest first and at most limit quotes; returns how many
+
+        The rest stays pending, so a big import can be indexed in chunks with
+        other work in between.
+        """
+        with self._lock:
+            if limit is None or limit >= len(self._unindexed):
+                batch, self._unindexed = self._unindexed, []
+            else:
+                batch = self._unindexed[:limit]
+                del self._unindexed[:limit]
+            count = 0
+            with METRICS.timer("storage_seconds", op="index"):
+                for quote in batch:
+                    if self._by_id.get(quote.id) is not quote:
+                        # Deleted meanwhile
+                        continue
+                    if self._search is not None:
+                        # An edit in between may have indexed it already
+                        self._search.remove(quote.id)
+                    self._index(quote)
+                    count += 1
+        return count
+
+    def edit(self, quote_id, text):
+        quote = self.get(quote_id)
+        if quote is None:
+            return None
+        with self._lock:
+            quote.text = text
+            self._index_status(quote)
+            if self._search is not None:
+                self._search.remove(quote_id)
+                self._search.add(quote_id, text, quote.author)
+            elif self._search_dirty is not None:
+                self._search_dirty.add(quote_id)
+        self._commit({"op": "edit", "id": quote_id, "text": text})
+        return quote
+
+    def delete(self, quote_id):
+        self.refresh()
+        with self._lock:
+            quote = self._by_id.pop(quote_id, None)
+            if quote is None:
+                return None
+            self._unindex(quote)
+            self._list = None
+        self._commit({"op": "delete", "id": quote_id})
+        return quote
+
+    def __len__(self):
+        self.refresh()
+        return len(self._by_id)
+
+
+# -------------------------------
+# Daily quote
+# -------------------------------
+def seconds_until_midnight(now=None):
+    """Seconds until the next local midnight"""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds()
+
+
+class DailyPicker:
+    """Today's quote and status quote, picked once per local day
+
+    Picks are cached until midnight and persisted to a small JSON file, so
+    quotes added during the day (or a restart) don't reshuffle them. A pick is
+    only redone if its quote gets deleted.
+    """
+
+    def __init__(self, store, path):
+        self.store = store
+        self.path = pathlib.Path(path)
+        self._day = None
+        self._picks = {}
+
+    @staticmethod
+    def _position(day, count):
+        hash_int = int(hashlib.md5(day.encode()).hexdigest(), 16)
+        return hash_int % count
+
+    def _roll_over(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if self._day == today:
+            return today
+        self._day = today
+        saved = read_meta(self.path)
+        self._picks = saved.get("picks", {}) if saved.get("day") == today else {}
+        return today
+
+    def _pick(self, kind, count, quote_at):
+        today = self._roll_over()
+        quote_id = self._picks.get(kind)
+        if quote_id is not None:
+            quote = self.store.get(quote_id)
+            if quote is not None:
+                return quote
+
+        if not count:
+            return None
+        quote = quote_at(self._position(today, count))
+        self._picks[kind] = quote.id
+        try:
+            write_json_atomic(self.path, {"day": today, "picks": self._picks})
+        except Exception as e:
+            print(f"Error saving daily pick: {e}")
+        return quote
+
+    def quote(self):
+        """Today's quote for /daily"""
+        return self._pick("quote", len(self.store), self.store.quote_at)
+
+    def status_quote(self):
+        """Today's quote for the bot status, from quotes that fit in it"""
+        return self._pick("status", self.store.status_count(), self.store.status_quote_at)
+
+
+# -------------------------------
+# Random selection
+# -------------------------------
+class ShuffleBag:
+    """Lazy Fisher-Yates shuffle over the slots 0..size-1
+
+    Only slots that were swapped are stored, so a fresh bag costs no memory
+    and each draw is O(1). size may grow between draws: new slots simply join
+    the part of the bag that hasn't been drawn yet.
+    """
+
+    __slots__ = ("drawn", "epoch", "_swaps")
+
+    def __init__(self, epoch=0):
+        self.drawn = 0
+        self.epoch = epoch
+        self._swaps = {}
+
+    def draw(self, size, rng):
+        k = self.drawn
+        j = rng.randrange(k, size)
+        picked = self._swaps.get(j, j)
+        if j != k:
+            self._swaps[j] = self._swaps.get(k, k)
+        self._swaps.pop(k, None)
+        self.drawn += 1
+        return picked
+
+    def put_back(self, value):
+        """Return a drawn value to the undrawn part of the bag"""
+        self.drawn -= 1
+        if value == self.drawn:
+            self._swaps.pop(self.drawn, None)
+        else:
+            self._swaps[self.drawn] = value
+
+    def reset(self):
+        self.drawn = 0
+        self._swaps.clear()
+
+    def refill(self, size, undrawn):
+        """Restart as a bag over 0..size-1 where only the slots in undrawn are left"""
+        self.reset()
+        self.drawn = size - len(undrawn)
+        for position, slot in enumerate(undrawn, self.drawn):
+            if slot != position:
+                self._swaps[position] = slot
+
+
+class QuoteShuffler:
+    """No-repeat random quotes: one ShuffleBag per key (user or guild)
+
+    Bags shuffle slots in a shared, sorted list of ids rather than the quotes
+    themselves, so quotes added later join every open bag and deleted ids are
+    just skipped. Once deleted ids make up most of the list it is compacted,
+    and each bag is carried over to the new list the next time it's used. With
+    recent_bias > 0, that share of draws takes two candidates and keeps the
+    newer one, putting the other back in the bag.
+    """
+
+    def __init__(self, store, recent_bias=0.0, max_bags=10000, rng=None):
+        self.store = store
+        self.recent_bias = recent_bias
+        self.max_bags = max_bags
+        self.rng = rng or random.Random()
+        self._bags = OrderedDict()
+        self._slots = []
+        self._old_slots = []
+        self._bound = 1
+        self._epoch = 0
+
+    def _sync_slots(self):
+        """Add newly allocated ids to the slot list, or compact it if it's mostly deleted ids"""
+        bound = self.store.id_bound()
+        if len(self._slots) + bound - self._bound > 2 * len(self.store) + 64:
+            self._old_slots = self._slots
+            self._slots = sorted(q.id for q in self.store.all())
+            self._epoch += 1
+        else:
+            self._slots.extend(range(self._bound, bound))
+        self._bound = bound
+
+    def _carry_over(self, bag):
+        """Move a bag from the slot list before the last compaction to the current one"""
+        if bag.epoch == self._epoch - 1 and bag.drawn:
+            old = self._old_slots
+            left = {old[bag._swaps.get(i, i)] for i in range(bag.drawn, len(old))}
+            drawn = set(old).difference(left)
+            undrawn = [slot for slot, quote_id in enumerate(self._slots) if quote_id not in drawn]
+            bag.refill(len(self._slots), undrawn)
+        else:
+            # Nothing drawn yet, or idle through two compactions: just start over
+            bag.reset()
+        bag.epoch = self._epoch
+
+    def _bag(self, key):
+        bag = self._bags.get(key)
+        if bag is None:
+            bag = self._bags[key] = ShuffleBag(self._epoch)
+            if len(self._bags) > self.max_bags:
+                self._bags.popitem(last=False)
+        else:
+            self._bags.move_to_end(key)
+            if bag.epoch != self._epoch:
+                self._carry_over(bag)
+        return bag
+
+    def _draw_existing(self, bag, size):
+        """Next quote from the bag, skipping ids that were deleted"""
+        while bag.drawn < size:
+            slot = bag.draw(size, self.rng)
+            quote = self.store.get(self._slots[slot])
+            if quote is not None:
+                return slot, quote
+        return None, None
+
+    def draw(self, key):
+        """Random quote for key, without repeats until every quote has come up"""
+        if not len(self.store):
+            return None
+        self._sync_slots()
+        bag = self._bag(key)
+        size = len(self._slots)
+
+        slot, quote = self._draw_existing(bag, size)
+        if quote is None:
+            # Bag exhausted, start a new pass
+            bag.reset()
+            slot, quote = self._draw_existing(bag, size)
+
+        if quote is not None and self.recent_bias and self.rng.random() < self.recent_bias:
+            other_slot, other = self._draw_existing(bag, size)
+            if other is not None:
+                if other.id > quote.id:
+                    bag.put_back(slot)
+                    quote = other
+                else:
+                    bag.put_back(other_slot)
+        return quote
+
+
+# -------------------------------
+# Namespaces
+# -------------------------------
+NAMESPACE_RE = re.compile(r"^[\w-]+$")
+
+# Every file a store may keep next to its quotes.json
+SHARD_SUFFIXES = (".json", ".meta.json", ".journal", ".journal.compacting", ".db", ".db-wal", ".db-shm")
+
+
+def legacy_files(legacy_path):
+    """Names of the pre-namespace storage files still next to legacy_path"""
+    legacy_path = pathlib.Path(legacy_path)
+    return [
+        legacy_path.stem + suffix for suffix in SHARD_SUFFIXES
+        if legacy_path.with_name(legacy_path.stem + suffix).exists()
+    ]
+
+
+def migrate_to_namespace(legacy_path, shard_path):
+    """Move a pre-namespace quotes.json and its sidecars into a namespace shard"""
+    legacy_path = pathlib.Path(legacy_path)
+    shard_path = pathlib.Path(shard_path)
+    moved = []
+    for suffix in SHARD_SUFFIXES:
+        src = legacy_path.with_name(legacy_path.stem + suffix)
+        dst = shard_path.with_name(shard_path.stem + suffix)
+        if src.exists() and not dst.exists():
+            os.replace(src, dst)
+            moved.append(dst.name)
+    if moved:
+        print(f"Migrated {', '.join(moved)} into namespace {shard_path.stem}")
+    return moved
+
+
+class _Namespace:
+    __slots__ = ("store", "daily", "shuffler", "last_used")
+
+    def __init__(self, store, daily, shuffler):
+        self.store = store
+        self.daily = daily
+        self.shuffler = shuffler
+        self.last_used = time.monotonic()
+
+
+def gateway_shard_for(namespace, shard_count):
+    """Gateway shard that serves a namespace; DMs always arrive on shard 0"""
+    if namespace.isdigit():
+        return (int(namespace) >> 22) % shard_count
+    return 0
+
+
+class QuoteRegistry:
+    """Quote stores partitioned by namespace (a guild id, or one per DM user)
+
+    Each namespace has its own storage shard in `directory`, its own indexes,
+    daily picks and shuffle bags. Shards are loaded on first use and can be
+    dropped from memory once idle. Loaded namespaces are grouped by the
+    gateway shard whose guilds they belong to.
+    """
+
+    def __init__(self, directory, kind="json", backend_options=None, writer_options=None, recent_bias=0.0,
+                 shard_count=1):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.kind = kind
+        self.backend_options = backend_options or {}
+        self.writer_options = writer_options
+        self.recent_bias = recent_bias
+        self.shard_count = shard_count
+        self._shards = {}
+        # Loads running on worker threads (namespace -> asyncio task), see quote_server
+        self.loading = {}
+
+    def set_shard_count(self, shard_count):
+        """Regroup loaded namespaces after the gateway shard count changed"""
+        if shard_count == self.shard_count:
+            return
+        entries = {ns: entry for namespaces in self._shards.values() for ns, entry in namespaces.items()}
+        self.shard_count = shard_count
+        self._shards = {}
+        for ns, entry in entries.items():
+            self._partition(ns)[ns] = entry
+
+    def _partition(self, namespace):
+        shard_id = gateway_shard_for(namespace, self.shard_count)
+        namespaces = self._shards.get(shard_id)
+        if namespaces is None:
+            namespaces = self._shards[shard_id] = {}
+        return namespaces
+
+    def shard_path(self, namespace):
+        if not NAMESPACE_RE.match(namespace):
+            raise ValueError(f"Invalid namespace: {namespace!r}")
+        return self.directory / f"{namespace}.json"
+
+    def _open(self, namespace):
+        path = self.shard_path(namespace)
+        store = QuoteStore(open_backend(self.kind, path, **self.backend_options))
+        if self.writer_options is not None:
+            store.start_writer(**self.writer_options)
+        daily = DailyPicker(store, path.with_name(f"{namespace}.daily.json"))
+        return _Namespace(store, daily, QuoteShuffler(store, recent_bias=self.recent_bias))
+
+    def _entry(self, namespace):
+        return self._shards.get(gateway_shard_for(namespace, self.shard_count), {}).get(namespace)
+
+    def stale(self, namespace):
+        """True if the namespace isn't loaded yet or its storage changed outside the bot"""
+        entry = self._entry(namespace)
+        return entry is None or entry.store.stale()
+
+    def prepare(self, namespace):
+        """Open the namespace, or reload it if its storage changed outside the bot
+
+        Only does the slow part, so it can run on a worker thread: a newly
+        opened namespace is returned for attach() instead of registered here.
+        """
+        entry = self._entry(namespace)
+        if entry is None:
+            return self._open(namespace)
+        entry.store.refresh()
+        return None
+
+    def attach(self, namespace, entry):
+        """Register a namespace opened by prepare()"""
+        namespaces = self._partition(namespace)
+        if namespace in namespaces:
+            # Opened on the spot in the meantime; keep that one
+            entry.store.close()
+            return
+        entry.last_used = time.monotonic()
+        namespaces[namespace] = entry
+
+    def _get(self, namespace):
+        namespaces = self._partition(namespace)
+        entry = namespaces.get(namespace)
+        if entry is None:
+            entry = namespaces[namespace] = self._open(namespace)
+        entry.last_used = time.monotonic()
+        return entry
+
+    def store(self, namespace):
+        return self._get(namespace).store
+
+    def daily(self, namespace):
+        return self._get(namespace).daily
+
+    def shuffler(self, namespace):
+        return self._get(namespace).shuffler
+
+    def loaded(self, shard_id=None):
+        """Loaded namespaces, optionally only those of one gateway shard"""
+        if shard_id is not None:
+            return list(self._shards.get(shard_id, ()))
+        return [ns for namespaces in self._shards.values() for ns in namespaces]
+
+    def pop(self, namespace):
+        """Forget a namespace (e.g. the bot left the guild); returns its store to close"""
+        entry = self._partition(namespace).pop(namespace, None)
+        return entry.store if entry else None
+
+    def pop_idle(self, max_idle, keep=()):
+        """Forget namespaces unused for max_idle seconds; returns their stores to close"""
+        cutoff = time.monotonic() - max_idle
+        stores = []
+        for namespaces in self._shards.values():
+            idle = [ns for ns, entry in namespaces.items() if entry.last_used < cutoff and ns not in keep]
+            stores.extend(namespaces.pop(ns).store for ns in idle)
+        return stores
+
+    def close(self):
+        for namespaces in self._shards.values():
+            for entry in namespaces.values():
+                entry.store.close()
+        self._shards.clear()
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import Counter
+
+# Discord allows 5 messages per 5 seconds per channel, ~50 requests per second
+# per bot and recommends at most 5 presence updates per 20 seconds
+CHANNEL_RATE = (5, 5.0)
+GLOBAL_RATE = (50, 1.0)
+PRESENCE_RATE = (5, 20.0)
+
+
+class TokenBucket:
+    """Allows `capacity` operations per `period` seconds, refilled continuously"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self):
+        """Seconds until a token is available"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self, timeout=None):
+        """Wait for a token; False if it wouldn't arrive within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            wait = self.delay()
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+
+class RateLimitScheduler:
+    """Paces Discord sends with one token bucket per route
+
+    Messages wait for both their route's bucket and a shared global bucket; a
+    send that can't go out within its max_wait is dropped instead of piling up.
+    Presence updates are coalesced per key (a gateway shard): only the most
+    recent pending one is sent once that key's presence bucket allows it.
+    """
+
+    def __init__(self, send_presence, route_rate=CHANNEL_RATE, global_rate=GLOBAL_RATE,
+                 presence_rate=PRESENCE_RATE):
+        self._send_presence = send_presence
+        self.route_rate = route_rate
+        self._routes = {}
+        self._global = TokenBucket(*global_rate)
+        self.presence_rate = presence_rate
+        self._presence = {}
+        self.sent = Counter()
+        self.deferred = Counter()
+        self.dropped = Counter()
+        self.presence_sent = 0
+        self.presence_coalesced = 0
+
+    @staticmethod
+    def _kind(route):
+        return route.split(":", 1)[0]
+
+    def _bucket(self, route):
+        bucket = self._routes.get(route)
+        if bucket is None:
+            bucket = self._routes[route] = TokenBucket(*self.route_rate)
+        return bucket
+
+    async def send(self, route, make_request, max_wait=None):
+        """Run make_request() once route and global limits allow it
+
+        Returns False if the send was dropped because it couldn't go out
+        within max_wait seconds.
+        """
+        start = time.monotonic()
+        kind = self._kind(route)
+        waited = False
+        for bucket in (self._bucket(route), self._global):
+            if bucket.try_acquire():
+                continue
+            waited = True
+            remaining = None if max_wait is None else max_wait - (time.monotonic() - start)
+            if remaining is not None and remaining <= 0:
+                acquired = False
+            else:
+                acquired = await bucket.acquire(remaining)
+            if not acquired:
+                self.dropped[kind] += 1
+                return False
+
+        if waited:
+            self.deferred[kind] += 1
+        await make_request()
+        self.sent[kind] += 1
+        return True
+
+    def forget(self, route):
+        """Drop the bucket of a route that is no longer used"""
+        self._routes.pop(route, None)
+
+    def update_presence(self, value, key=None):
+        """Queue a presence update for key, replacing any that hasn't been sent yet"""
+        presence = self._presence.get(key)
+        if presence is None:
+            presence = self._presence[key] = _PendingPresence(self.presence_rate)
+        if presence.value is not None:
+            self.presence_coalesced += 1
+        presence.value = value
+        presence.event.set()
+        if presence.task is None or presence.task.done():
+            presence.task = asyncio.get_running_loop().create_task(self._presence_loop(key, presence))
+
+    async def _presence_loop(self, key, presence):
+        while True:
+            await presence.event.wait()
+            await presence.bucket.acquire()
+            presence.event.clear()
+            value = presence.value
+            presence.value = None
+            if value is None:
+                continue
+            try:
+                await self._send_presence(value, key)
+                self.presence_sent += 1
+            except Exception as e:
+                print(f"Presence update failed: {e}")
+
+    def metrics(self):
+        return {
+            "sent": dict(self.sent),
+            "deferred": dict(self.deferred),
+            "dropped": dict(self.dropped),
+            "presence_sent": self.presence_sent,
+            "presence_coalesced": self.presence_coalesced,
+            "routes": len(self._routes),
+        }
+
+    def close(self):
+        for presence in self._presence.values():
+            if presence.task is not None:
+                presence.task.cancel()
+        self._presence.clear()
+
+
+class _PendingPresence:
+    __slots__ = ("bucket", "value", "event", "task")
+
+    def __init__(self, rate):
+        self.bucket = TokenBucket(*rate)
+        self.value = None
+        self.event = asyncio.Event()
+        self.task = None
@@ -0,0 +1,107 @@
+import asyncio
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import quote_server
+from quote_io import decode_lines, export_quotes, import_quotes, read_records
+from quote_store import QuoteRegistry
+from quote_server import LocalQuotes
+
+
+async def chunked(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(records):
+    return [record async for record in records]
+
+
+class StreamingImportTest(unittest.TestCase):
+    def test_chunks_split_inside_characters_and_rows(self):
+        data = '﻿text,author,date\n"zażółć\nw dwóch liniach",Ala,01/01/2024\r\n"say ""hi""",Bob,\n'.encode("utf-8")
+        for size in (1, 2, 3, 7, len(data)):
+            records = asyncio.run(collect(read_records(decode_lines(chunked(data, size)), "csv")))
+            self.assertEqual(records, [
+                (2, {"text": "zażółć\nw dwóch liniach", "author": "Ala", "date": "01/01/2024"}),
+                (4, {"text": 'say "hi"', "author": "Bob", "date": ""}),
+            ])
+
+    def test_jsonl_line_separators_inside_strings(self):
+        data = '{"text": "a\u2028b", "author": "Ala"}\n\nnot json\n'.encode("utf-8")
+        records = asyncio.run(collect(read_records(decode_lines(chunked(data, 5)), "jsonl")))
+        self.assertEqual(records[0], (1, {"text": "a\u2028b", "author": "Ala"}))
+        self.assertEqual(records[1][0], 3)
+        self.assertIsInstance(records[1][1], str)
+
+    def test_import_from_stream(self):
+        data = b"".join(f'{{"text": "quote {n}", "author": "Ala", "date": "01/01/2024"}}\n'.encode() for n in range(250))
+        with tempfile.TemporaryDirectory() as tmp:
+            quotes = LocalQuotes(QuoteRegistry(pathlib.Path(tmp)))
+
+            async def run():
+                try:
+                    report = await import_quotes(quotes, "1", decode_lines(chunked(data, 1000)), "jsonl", batch_size=100)
+                    return report, await quotes.count("1")
+                finally:
+                    await quotes.close()
+
+            report, count = asyncio.run(run())
+        self.assertEqual(count["quotes"], 250)
+        self.assertIn("250", report.summary())
+
+    @mock.patch.object(quote_server, "INDEX_CHUNK_SIZE", 100)
+    def test_indexing_an_import_yields_to_the_event_loop(self):
+        records = [{"text": f"quote {n}", "author": "Ala", "date": "01/01/2024"} for n in range(1000)]
+        with tempfile.TemporaryDirectory() as tmp:
+            quotes = LocalQuotes(QuoteRegistry(pathlib.Path(tmp)))
+
+            async def run():
+                try:
+                    await quotes.import_batch("1", records)
+                    ticks = 0
+                    finishing = asyncio.create_task(quotes.finish_import("1"))
+                    while not finishing.done():
+                        ticks += 1
+                        await asyncio.sleep(0)
+                    return ticks, await finishing, await quotes.count("1", author="ala")
+                finally:
+                    await quotes.close()
+
+            ticks, indexed, count = asyncio.run(run())
+        self.assertGreaterEqual(ticks, 10)
+        self.assertEqual(indexed, 1000)
+        self.assertEqual(count["author"], 1000)
+
+
+class ExportTest(unittest.TestCase):
+    def test_export_yields_between_pages(self):
+        records = [{"text": f"quote {n}", "author": "Ala", "date": "01/01/2024"} for n in range(250)]
+        with tempfile.TemporaryDirectory() as tmp:
+            quotes = LocalQuotes(QuoteRegistry(pathlib.Path(tmp)))
+
+            async def run():
+                try:
+                    await quotes.import_batch("1", records)
+                    await quotes.finish_import("1")
+                    ticks = 0
+                    with open(pathlib.Path(tmp) / "out.jsonl", "w", encoding="utf-8") as f:
+                        exporting = asyncio.create_task(export_quotes(quotes, "1", "jsonl", f, page_size=50))
+                        while not exporting.done():
+                            ticks += 1
+                            await asyncio.sleep(0)
+                    return ticks, await exporting
+                finally:
+                    await quotes.close()
+
+            ticks, count = asyncio.run(run())
+            lines = (pathlib.Path(tmp) / "out.jsonl").read_text(encoding="utf-8").splitlines()
+        self.assertEqual(count, 250)
+        self.assertEqual(len(lines), 250)
+        self.assertGreaterEqual(ticks, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
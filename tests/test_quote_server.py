@@ -0,0 +1,128 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import quote_server
+from quote_store import QuoteRegistry
+from quote_server import LocalQuotes, QuoteClient, QuoteServer, QuoteServerError
+
+
+class NamespaceLoadingTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.registry = QuoteRegistry(self._tmp.name)
+        self.quotes = LocalQuotes(self.registry)
+
+    def tearDown(self):
+        asyncio.run(self.quotes.close())
+        self._tmp.cleanup()
+
+    def test_namespace_loads_once_off_the_event_loop(self):
+        threads = []
+        prepare = self.registry.prepare
+
+        def recording_prepare(namespace):
+            threads.append(threading.current_thread())
+            return prepare(namespace)
+
+        self.registry.prepare = recording_prepare
+
+        async def first_requests():
+            await self.quotes.add("1", "kawa", "Ala", "01/01/2024")
+            self.registry.pop("1").close()
+            return await asyncio.gather(*(self.quotes.get("1", 1) for _ in range(5)))
+
+        results = asyncio.run(first_requests())
+        self.assertEqual([q["text"] for q in results], ["kawa"] * 5)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+        self.assertEqual(self.registry.loading, {})
+
+    def test_loaded_is_read_only(self):
+        # Guild ids whose gateway shard out of 2 is 1
+        namespace = str(1 << 22)
+
+        async def run():
+            await self.quotes.count(namespace)
+            before = await self.quotes.loaded(1)
+            await self.quotes.set_shard_count(2)
+            return before, await self.quotes.loaded(0), await self.quotes.loaded(1)
+
+        before, shard_0, shard_1 = asyncio.run(run())
+        self.assertEqual(before, [])
+        self.assertEqual(self.registry.shard_count, 2)
+        self.assertEqual((shard_0, shard_1), ([], [namespace]))
+
+
+class OversizedMessageTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    @mock.patch.object(quote_server, "MAX_MESSAGE_BYTES", 4096)
+    def test_oversized_reply_fails_only_its_request(self):
+        async def run():
+            server = QuoteServer(QuoteRegistry(self._tmp.name), os.path.join(self._tmp.name, "quotes.sock"))
+            await server.start()
+            client = QuoteClient(server.path)
+            try:
+                for n in range(40):
+                    await client.add("1", f"quote {n} " + "x" * 100, "Ala", "01/01/2024")
+                small = client.get("1", 1)
+                big = client.page("1", 0, 1000)
+                other = client.count("1")
+                results = await asyncio.gather(small, big, other, return_exceptions=True)
+                self.assertEqual(results[0]["id"], 1)
+                self.assertIsInstance(results[1], QuoteServerError)
+                self.assertEqual(results[2]["quotes"], 40)
+                with self.assertRaises(QuoteServerError):
+                    await client.add("1", "y" * 5000, "Ala", "01/01/2024")
+                self.assertEqual(len(await client.page("1", 0, 10)), 10)
+            finally:
+                await client.close()
+                await server.close()
+
+        asyncio.run(run())
+
+
+class ConcurrentRequestTest(unittest.TestCase):
+    def test_cold_load_does_not_hold_up_other_requests(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = QuoteRegistry(tmp)
+            release = threading.Event()
+            prepare = registry.prepare
+
+            def slow_prepare(namespace):
+                if namespace == "2":
+                    release.wait(10)
+                return prepare(namespace)
+
+            registry.prepare = slow_prepare
+
+            async def run():
+                server = QuoteServer(registry, os.path.join(tmp, "quotes.sock"))
+                await server.start()
+                client = QuoteClient(server.path)
+                try:
+                    await client.add("1", "kawa", "Ala", "01/01/2024")
+                    cold = asyncio.create_task(client.count("2"))
+                    quote = await asyncio.wait_for(client.get("1", 1), 5)
+                    self.assertFalse(cold.done())
+                    release.set()
+                    self.assertEqual((await cold)["quotes"], 0)
+                    return quote
+                finally:
+                    release.set()
+                    await client.close()
+                    await server.close()
+
+            self.assertEqual(asyncio.run(run())["text"], "kawa")
+
+
+if __name__ == "__main__":
+    unittest.main()
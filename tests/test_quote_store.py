@@ -0,0 +1,318 @@
+import gc
+import json
+import os
+import pathlib
+import random
+import sqlite3
+import tempfile
+import unittest
+import weakref
+from unittest import mock
+
+from quote_store import STATUS_MAX_LEN, QuoteShuffler, QuoteStore, SearchIndex, ShuffleBag, open_backend
+
+
+class JournalRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self._tmp.name) / "quotes.json"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def open_store(self):
+        return QuoteStore(open_backend("journal", self.path))
+
+    def test_appends_after_torn_record_survive_restart(self):
+        store = self.open_store()
+        for n in range(3):
+            store.add(f"quote {n}", "Ala", "01/01/2024")
+        store.close()
+        # A crash mid-append leaves an unterminated record behind
+        with open(self.path.with_name("quotes.journal"), "a", encoding="utf-8") as f:
+            f.write('{"op": "add", "quote": {"id": 4, "te')
+
+        store = self.open_store()
+        self.assertEqual([q["id"] for q in store.all()], [1, 2, 3])
+        store.add("quote 4", "Bob", "01/01/2024")
+        store.add("quote 5", "Bob", "01/01/2024")
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual([q["id"] for q in store.all()], [1, 2, 3, 4, 5])
+        self.assertEqual(store.id_bound(), 6)
+        store.close()
+
+    def test_own_compaction_is_not_an_outside_change(self):
+        store = self.open_store()
+        for n in range(3):
+            store.add(f"quote {n}", "Ala", "01/01/2024")
+        store.backend.compact(store)
+        self.assertFalse(store.backend.changed())
+        store.backend.wait_for_compaction()
+        self.assertFalse(store.backend.changed())
+
+        self.path.write_text('[{"id": 7, "text": "edited by hand", "author": "Ala", "date": "01/01/2024"}]', encoding="utf-8")
+        self.assertTrue(store.backend.changed())
+        self.assertEqual([q["id"] for q in store.all()], [7])
+        store.close()
+
+
+class OutsideEditTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self._tmp.name) / "quotes.json"
+        self.store = QuoteStore(open_backend("json", self.path))
+        self.store.add("kawa", "Ala", "01/01/2024")
+        self.store.add("herbata", "Ala", "01/01/2024")
+        self.store.start_writer(delay=3600, max_pending=1000)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def edit_outside(self):
+        quotes = json.loads(self.path.read_text(encoding="utf-8"))
+        quotes.append({"id": 50, "text": "added by hand", "author": "Bob", "date": "01/01/2024"})
+        quotes[0]["text"] = "kawa z mlekiem"
+        self.path.write_text(json.dumps(quotes), encoding="utf-8")
+        stat = self.path.stat()
+        # Make sure the edit is seen even on a coarse-grained clock
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def assert_both_survive(self, store):
+        self.assertEqual(
+            [(q["id"], q["text"]) for q in store.all()],
+            [(1, "kawa z mlekiem"), (50, "added by hand"), (51, "sok")]
+        )
+        self.assertIsNone(store.get(2))
+
+    def assert_both_survive_restart(self):
+        store = QuoteStore(open_backend("json", self.path))
+        self.assert_both_survive(store)
+        store.close()
+
+    def test_queued_changes_are_redone_on_top_of_an_outside_edit(self):
+        self.store.delete(2)
+        self.edit_outside()
+        self.assertEqual(self.store.add("sok", "Ala", "01/01/2024")["id"], 51)
+        self.assert_both_survive(self.store)
+        self.store.close()
+        self.assert_both_survive_restart()
+
+    def test_flush_does_not_overwrite_an_outside_edit(self):
+        self.store.delete(2)
+        self.edit_outside()
+        self.store.flush()
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8"))[-1]["id"], 50)
+        self.store.add("sok", "Ala", "01/01/2024")
+        self.store.close()
+        self.assert_both_survive_restart()
+
+
+class SQLiteMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self._tmp.name) / "quotes.json"
+        quotes = [{"id": n, "text": f"quote {n}", "author": "Ala", "date": "01/01/2024"} for n in (1, 2)]
+        self.path.write_text(json.dumps(quotes), encoding="utf-8")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def open_store(self):
+        return QuoteStore(open_backend("sqlite", self.path))
+
+    def test_json_is_not_imported_again_once_emptied(self):
+        store = self.open_store()
+        self.assertEqual([q["id"] for q in store.all()], [1, 2])
+        store.delete(1)
+        store.delete(2)
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual(store.all(), [])
+        self.assertEqual(store.add("quote 3", "Ala", "01/01/2024")["id"], 3)
+        store.close()
+
+    def test_old_schema_is_upgraded(self):
+        conn = sqlite3.connect(self.path.with_suffix(".db"))
+        conn.executescript("""
+            CREATE TABLE quotes (id INTEGER PRIMARY KEY, text TEXT NOT NULL, author TEXT NOT NULL,
+                                 date TEXT NOT NULL, fits_status INTEGER NOT NULL);
+            CREATE INDEX idx_quotes_fits_status ON quotes (fits_status, id);
+            CREATE TABLE quote_authors (author_key TEXT NOT NULL, quote_id INTEGER NOT NULL,
+                                        PRIMARY KEY (author_key, quote_id)) WITHOUT ROWID;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT INTO quotes VALUES (5, 'kept', 'Bob', '02/02/2024', 1);
+            INSERT INTO meta VALUES ('next_id', 6);
+        """)
+        conn.close()
+
+        store = self.open_store()
+        self.assertEqual([q["text"] for q in store.all()], ["kept"])
+        store.edit(5, "edited")
+        store.add("quote 6", "Ala", "01/01/2024")
+        store.close()
+
+        store = self.open_store()
+        self.assertEqual([(q["id"], q["text"]) for q in store.all()], [(5, "edited"), (6, "quote 6")])
+        store.close()
+
+
+class InternTableTest(unittest.TestCase):
+    def test_interned_strings_go_with_the_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteStore(open_backend("json", pathlib.Path(tmp) / "quotes.json"))
+            first = store.add("kawa", "Ala", "01/01/2024")
+            second = store.add("herbata", "Ala", "01/01/2024")
+            self.assertIs(first.author, second.author)
+            self.assertIs(first.day, second.day)
+            table = weakref.ref(store._interned)
+            store.close()
+            del store, first, second
+            gc.collect()
+            self.assertIsNone(table())
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(1, "Kawa na ławę", "Ala")
+        self.index.add(2, "kawa, kawa i jeszcze raz kawa", "Bob")
+        self.index.add(3, "herbata z cytryną", "Ala")
+
+    def test_ranking_favours_term_frequency(self):
+        self.assertEqual([quote_id for quote_id, _ in self.index.search("kawa")], [2, 1])
+        self.assertEqual([quote_id for quote_id, _ in self.index.search("ala lawe")][0], 1)
+
+    def test_fuzzy_and_prefix_hits(self):
+        self.assertEqual([quote_id for quote_id, _ in self.index.search("herbatta")], [3])
+        self.assertEqual(list(self.index.prefix_tokens("cy")), ["cytryna"])
+
+    def test_edits_and_deletes_drop_old_tokens(self):
+        self.index.remove(3)
+        self.index.add(3, "zielona herbata", "Ala")
+        self.index.remove(2)
+        self.assertEqual(self.index.search("cytryna"), [])
+        self.assertEqual(list(self.index.prefix_tokens("cy")), [])
+        self.assertEqual([quote_id for quote_id, _ in self.index.search("zielona")], [3])
+        self.assertEqual([quote_id for quote_id, _ in self.index.search("kawa")], [1])
+        self.assertEqual(self.index.postings("bob"), {})
+
+    def test_store_search_follows_edits_and_deletes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteStore(open_backend("json", pathlib.Path(tmp) / "quotes.json"))
+            kawa = store.add("kawa na ławę", "Ala", "01/01/2024")
+            herbata = store.add("herbata z cytryną", "Bob", "01/01/2024")
+            store.edit(kawa.id, "espresso doppio")
+            store.delete(herbata.id)
+            self.assertEqual(store.search("kawa"), [])
+            self.assertEqual(store.search("cytryna"), [])
+            self.assertEqual(store.search("espreso"), [kawa])
+            store.close()
+
+
+class AutocompleteTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = QuoteStore(open_backend("json", pathlib.Path(self._tmp.name) / "quotes.json"))
+        for n in range(1, 41):
+            self.store.add(f"kawa numer {n}", "Ala" if n % 2 else "Bob", "01/01/2024")
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def test_suggestions_stop_at_the_limit(self):
+        self.assertEqual([q.id for q in self.store.suggest("")], list(range(40, 15, -1)))
+        self.assertEqual([q.id for q in self.store.suggest("#1", limit=5)], [1, 10, 11, 12, 13])
+        self.assertEqual(len(self.store.suggest("kaw")), 25)
+        self.assertEqual([q.id for q in self.store.suggest("numer 3", limit=3)], [3, 30, 31])
+
+    def test_suggestions_only_cover_the_authors_quotes(self):
+        self.assertEqual([q.id for q in self.store.suggest("", author="BOB", limit=3)], [40, 38, 36])
+        self.assertEqual([q.id for q in self.store.suggest("3", author="ala")], [39, 37, 35, 33, 31, 3])
+        self.store.delete(39)
+        self.assertEqual([q.id for q in self.store.suggest("kawa", author="ala", limit=2)], [37, 35])
+
+    def test_authors_keep_the_newest_casing(self):
+        self.store.add("herbata", "Alan, bob", "01/01/2024")
+        self.assertEqual(self.store.suggest_authors("AL"), ["Ala", "Alan"])
+        self.assertEqual(self.store.suggest_authors("b"), ["bob"])
+        self.assertEqual(self.store.suggest_authors("", limit=2), ["Ala", "Alan"])
+        self.assertEqual(self.store.suggest_authors("zz"), [])
+
+
+class StatusPoolTest(unittest.TestCase):
+    def test_status_text_follows_edits(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteStore(open_backend("json", pathlib.Path(tmp) / "quotes.json"))
+            quote = store.add("  kawa   na  ławę ", "Ala", "01/01/2024")
+            self.assertEqual(store.status_text(quote), '"kawa na ławę" - Ala')
+            self.assertEqual(store.status_count(), 1)
+
+            store.edit(quote.id, "x" * STATUS_MAX_LEN)
+            self.assertEqual(store.status_count(), 0)
+            store.edit(quote.id, "herbata")
+            self.assertEqual(store.status_text(quote), '"herbata" - Ala')
+            self.assertEqual(store.status_quote_at(0).id, quote.id)
+            store.close()
+
+
+class ShufflerTest(unittest.TestCase):
+    def test_bag_draws_each_slot_once_as_it_grows(self):
+        bag = ShuffleBag()
+        rng = random.Random(3)
+        drawn = [bag.draw(10, rng) for _ in range(5)]
+        bag.put_back(drawn.pop())
+        drawn += [bag.draw(15, rng) for _ in range(11)]
+        self.assertEqual(sorted(drawn), list(range(15)))
+        bag.reset()
+        self.assertEqual(sorted(bag.draw(15, rng) for _ in range(15)), list(range(15)))
+
+    def test_no_repeats_within_a_cycle_across_inserts_and_deletes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = QuoteStore(open_backend("json", pathlib.Path(tmp) / "quotes.json"))
+            for n in range(20):
+                store.add(f"quote {n}", "Ala", "01/01/2024")
+            shuffler = QuoteShuffler(store, recent_bias=0.3, rng=random.Random(4))
+            first = [shuffler.draw("user").id for _ in range(8)]
+            deleted = [quote_id for quote_id in range(1, 21) if quote_id not in first][:4]
+            for quote_id in deleted:
+                store.delete(quote_id)
+            added = [store.add(f"new {n}", "Bob", "01/01/2024").id for n in range(5)]
+
+            rest = [shuffler.draw("user").id for _ in range(len(store) - len(first))]
+            cycle = first + rest
+            self.assertEqual(len(set(cycle)), len(cycle))
+            self.assertEqual(set(cycle), {q.id for q in store.all()})
+            self.assertTrue(set(added) <= set(rest))
+            self.assertFalse(set(deleted) & set(rest))
+            # The next draw starts a new cycle
+            self.assertIn(shuffler.draw("user").id, set(cycle))
+            store.close()
+
+    def test_draws_stay_cheap_and_unrepeated_after_mass_deletion(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp) / "quotes.json"
+            quotes = [{"id": n, "text": f"quote {n}", "author": "Ala", "date": "01/01/2024"} for n in range(1, 2001)]
+            path.write_text(json.dumps(quotes), encoding="utf-8")
+            store = QuoteStore(open_backend("journal", path))
+            shuffler = QuoteShuffler(store, rng=random.Random(1))
+            first = [shuffler.draw("user").id for _ in range(500)]
+            for quote_id in range(1, 2001):
+                if quote_id % 20:
+                    store.delete(quote_id)
+
+            live = {q.id for q in store.all()}
+            left = live.difference(first)
+            with mock.patch.object(store, "get", wraps=store.get) as get:
+                rest = [shuffler.draw("user").id for _ in range(len(left))]
+            self.assertEqual(sorted(rest), sorted(left))
+            self.assertLessEqual(get.call_count, 3 * len(left))
+            self.assertEqual(sorted(shuffler.draw("user").id for _ in range(len(live))), sorted(live))
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import pathlib
+import tempfile
+import unittest
+
+from benchmarks.common import load_bot
+
+main = None
+_tmp = None
+
+
+def setUpModule():
+    global main, _tmp
+    _tmp = tempfile.TemporaryDirectory()
+    main = load_bot(pathlib.Path(_tmp.name))
+
+
+def tearDownModule():
+    _tmp.cleanup()
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = main.RenderCache(max_entries=3)
+        self.renders = 0
+
+    def render(self, value):
+        def render():
+            self.renders += 1
+            return value
+        return render
+
+    def test_hits_until_the_quote_is_edited(self):
+        quote = {"id": 1, "text": "kawa", "author": "Ala"}
+        for _ in range(3):
+            self.assertEqual(self.cache.get(("quote", "1", 1, quote["text"]), (("1", 1),), self.render("A")), "A")
+        self.assertEqual((self.renders, self.cache.hits, self.cache.misses), (1, 2, 1))
+
+        # An edit elsewhere changes the text in the key, so the old entry is never served
+        self.assertEqual(self.cache.get(("quote", "1", 1, "herbata"), (("1", 1),), self.render("B")), "B")
+        self.assertEqual(self.renders, 2)
+
+    def test_edit_and_delete_drop_every_entry_showing_the_quote(self):
+        self.cache.get(("quote", "1", 1, "kawa"), (("1", 1),), self.render("one"))
+        self.cache.get(("page", "1", 0), (("1", 1), ("1", 2)), self.render("page"))
+        self.cache.get(("quote", "2", 1, "kawa"), (("2", 1),), self.render("other guild"))
+
+        self.cache.invalidate("1", 1)
+        self.assertEqual(len(self.cache), 1)
+        self.cache.get(("page", "1", 0), (("1", 1), ("1", 2)), self.render("page"))
+        self.cache.get(("quote", "2", 1, "kawa"), (("2", 1),), self.render("other guild"))
+        self.assertEqual((self.renders, self.cache.hits), (4, 1))
+
+        self.cache.invalidate("1", 2)
+        self.cache.invalidate("2", 1)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache._by_quote, {})
+
+    def test_evicted_entries_are_unlinked(self):
+        for quote_id in range(1, 6):
+            self.cache.get(("quote", "1", quote_id, "kawa"), (("1", quote_id),), self.render(quote_id))
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(set(self.cache._by_quote), {("1", 3), ("1", 4), ("1", 5)})
+
+
+if __name__ == "__main__":
+    unittest.main()